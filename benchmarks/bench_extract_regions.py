@@ -0,0 +1,62 @@
+""" Times `extract_regions` on synthetic sources of doubling size to show that
+    the scanner scales linearly.
+
+    usage: python -m benchmarks.bench_extract_regions [--max-mb N] [--repeat N]
+"""
+from typing import *
+
+from argparse import ArgumentParser
+from time import perf_counter
+
+from rspecFppGen.generate_fpp import extract_regions
+
+# a few lines exercising every token kind in the main pattern
+BODY_LINES: Final[List[str]] = [
+    'def add(a, b):',
+    '    total = ?a + b?  # adds the arguments',
+    '    label = "sum: ?not a blank?" #0given',
+    "    return total, 'done' #blank",
+]
+
+
+def make_source(size: int) -> str:
+    """Returns a source of roughly `size` characters, half of it in one big region"""
+    body = '\n'.join(BODY_LINES) + '\n'
+    region_line = 'fixture_data = [1, 2, 3]  # kept verbatim\n'
+    halves = size // 2
+    return ''.join([
+        '"""A synthetic question"""\n',
+        body * max(1, halves // len(body)),
+        '## big_region ##\n',
+        region_line * max(1, halves // len(region_line)),
+        '## big_region ##\n',
+    ])
+
+
+def time_once(source: str, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = perf_counter()
+        extract_regions(source)
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def main():
+    parser = ArgumentParser(description='Benchmarks extract_regions on growing sources')
+    parser.add_argument('--max-mb', type=float, default=8, help='largest source size in MB')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per size (best is kept)')
+    args = parser.parse_args()
+
+    size = 1 << 16
+    print(f"{'size (KB)':>10} {'seconds':>10} {'MB/s':>8} {'ns/char':>8}")
+    while size <= args.max_mb * (1 << 20):
+        source = make_source(size)
+        seconds = time_once(source, args.repeat)
+        print(f"{len(source) >> 10:>10} {seconds:>10.4f} "
+              f"{len(source) / seconds / (1 << 20):>8.2f} {seconds / len(source) * 1e9:>8.1f}")
+        size *= 2
+
+
+if __name__ == '__main__':
+    main()
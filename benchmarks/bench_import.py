@@ -0,0 +1,67 @@
+""" Times how long the generator takes to start: importing the command line module,
+    and a whole `python -m rspecFppGen --help`, each in a fresh interpreter.
+    Also lists the modules `-X importtime` found slowest to import.
+
+    usage: python -m benchmarks.bench_import [--repeat N] [--top N]
+"""
+from typing import *
+
+import os
+import subprocess
+import sys
+from argparse import ArgumentParser
+from statistics import median
+from time import perf_counter
+
+# the repository root, where `rspecFppGen` is importable as a package
+ROOT: Final[str] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS: Final[Dict[str, List[str]]] = {
+    'import rspecFppGen.rspecFppGen': [sys.executable, '-c', 'import rspecFppGen.rspecFppGen'],
+    'python -m rspecFppGen --help': [sys.executable, '-m', 'rspecFppGen', '--help'],
+}
+
+
+def time_command(command: List[str], repeat: int) -> List[float]:
+    durations = []
+    for _ in range(repeat):
+        start = perf_counter()
+        subprocess.run(command, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        durations.append(perf_counter() - start)
+    return durations
+
+
+def slowest_imports(top: int) -> List[Tuple[int, int, str]]:
+    """The `top` modules with the largest cumulative import time, as (self us, cumulative us, name)"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import rspecFppGen.rspecFppGen'],
+                            cwd=ROOT, check=True, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line.removeprefix('import time:').split('|')
+        if len(fields) == 3 and fields[0].strip().isdigit():
+            rows.append((int(fields[0]), int(fields[1]), fields[2].rstrip()))
+    return sorted(rows, key=lambda row: row[1], reverse=True)[:top]
+
+
+def main():
+    parser = ArgumentParser(description='Benchmarks the start-up time of rspecFppGen')
+    parser.add_argument('--repeat', type=int, default=10, help='fresh interpreters per command')
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    args = parser.parse_args()
+
+    baseline = median(time_command([sys.executable, '-c', 'pass'], args.repeat))
+    print(f"{'command':<32} {'median (ms)':>12} {'min (ms)':>10} {'over bare python':>17}")
+    print(f"{'python -c pass':<32} {baseline * 1e3:>12.1f}")
+    for name, command in COMMANDS.items():
+        durations = time_command(command, args.repeat)
+        print(f"{name:<32} {median(durations) * 1e3:>12.1f} {min(durations) * 1e3:>10.1f} "
+              f"{(median(durations) - baseline) * 1e3:>17.1f}")
+
+    print(f"\n{'self (ms)':>10} {'cumulative (ms)':>16}  module")
+    for self_us, cumulative_us, name in slowest_imports(args.top):
+        print(f"{self_us / 1e3:>10.1f} {cumulative_us / 1e3:>16.1f}  {name}")
+
+
+if __name__ == '__main__':
+    main()
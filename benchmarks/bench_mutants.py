@@ -0,0 +1,52 @@
+""" Times mutant synthesis on synthetic applications of doubling size, serially and
+    on a process pool, and the rendering of the mutants as YAML.
+
+    usage: python -m benchmarks.bench_mutants [--max-kb K] [--files F] [--jobs N]
+"""
+from typing import *
+
+from argparse import ArgumentParser
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter
+
+from benchmarks.synth import make_app
+from rspecFppGen.mutants import mutants_yaml, source_files, synthesize
+
+
+def main():
+    parser = ArgumentParser(description='Benchmarks rspecFppGen.mutants on growing applications')
+    parser.add_argument('--max-kb', type=int, default=4096, help='largest application size in KB')
+    parser.add_argument('--files', type=int, default=200, help='ruby files per application')
+    parser.add_argument('--jobs', type=int, default=None, help='processes for the pooled run (default: one per core)')
+    args = parser.parse_args()
+
+    print(f"{'app (KB)':>9} {'mutants':>9} {'serial (s)':>11} {'pooled (s)':>11} {'yaml (s)':>9} {'mutants/s':>10}")
+    size_kb = 256
+    while size_kb <= args.max_kb:
+        root = mkdtemp(prefix='fpp-mutants-')
+        try:
+            make_app(root, args.files, size_kb)
+            files = source_files(root)
+
+            start = perf_counter()
+            mutants, _ = synthesize(root, files, jobs=1)
+            serial = perf_counter() - start
+
+            start = perf_counter()
+            synthesize(root, files, jobs=args.jobs)
+            pooled = perf_counter() - start
+
+            start = perf_counter()
+            mutants_yaml(mutants, root)
+            rendering = perf_counter() - start
+
+            print(f"{size_kb:>9} {len(mutants):>9} {serial:>11.3f} {pooled:>11.3f} {rendering:>9.3f} "
+                  f"{len(mutants) / min(serial, pooled):>10.0f}")
+        finally:
+            rmtree(root)
+        size_kb *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+""" Times each stage of the generator on a synthetic course and writes the
+    results as JSON: the whole `rspecFppGen.main` run, `extract_regions`,
+    `generate_variants` and the materialization of the common tree.
+
+    usage: python -m benchmarks.harness [--output results.json] [--repeat N]
+                                        [--questions N] [--mutations M] [--files F] [--app-kb K]
+"""
+from typing import *
+
+import os
+import sys
+from argparse import ArgumentParser
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+from json import dumps
+from platform import python_version
+from shutil import rmtree
+from statistics import mean, median
+from tempfile import mkdtemp
+from time import perf_counter
+
+import yaml
+
+from benchmarks.synth import add_course_args, make_course
+from rspecFppGen import materialize, preflight, rspecFppGen
+from rspecFppGen.cache import cache_root
+from rspecFppGen.fingerprint import tree_fingerprint
+from rspecFppGen.generate_fpp import extract_regions
+from rspecFppGen.materialize import STORE_DIR, materialize_tree
+from rspecFppGen.output import QuestionWriter
+
+
+def timed(fn: Callable[[], Any], repeat: int, setup: Callable[[], Any] = None) -> Dict[str, float]:
+    """Runs `fn` `repeat` times (calling `setup` untimed before each run) and summarizes the durations"""
+    durations = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = perf_counter()
+        fn()
+        durations.append(perf_counter() - start)
+    return {
+        'min': min(durations), 'median': median(durations),
+        'mean': mean(durations), 'runs': len(durations),
+    }
+
+
+def quietly(fn: Callable[[], Any]) -> Callable[[], Any]:
+    def run():
+        with redirect_stdout(StringIO()), redirect_stderr(StringIO()):
+            try:
+                fn()
+            except SystemExit as e:
+                if e.code:
+                    raise RuntimeError(f"{fn} exited with {e.code}")
+    return run
+
+
+def clear_caches() -> None:
+    """Empties the on-disk cache (under the work directory, see `main`) and the in-process ones"""
+    rmtree(cache_root(), ignore_errors=True)
+    materialize._trees.clear()
+    materialize._verified.clear()
+    tree_fingerprint.cache_clear()
+    preflight._digest_lines.cache_clear()
+
+
+def bench_main(course, work: str, repeat: int, jobs: int) -> Dict[str, float]:
+    destination = os.path.join(work, 'main')
+
+    def setup():
+        rmtree(destination, ignore_errors=True)
+        os.makedirs(destination)
+        # every run starts cold, as a fresh process with an empty cache would
+        clear_caches()
+
+    def run():
+        sys.argv = ['rspecFppGen', '--jobs', str(jobs), destination, course.app_root, *course.yaml_paths]
+        rspecFppGen.main()
+
+    return timed(quietly(run), repeat, setup)
+
+
+def bench_extract_regions(course, repeat: int) -> Dict[str, float]:
+    sources = []
+    for yaml_path in course.yaml_paths:
+        with open(yaml_path) as f:
+            sources.append(yaml.safe_load(f)['solution']['lines'])
+    return timed(lambda: [extract_regions(s) for s in sources], repeat)
+
+
+def bench_generate_variants(course, work: str, repeat: int) -> Dict[str, float]:
+    q_root = os.path.join(work, 'variants')
+    store = os.path.join(work, STORE_DIR)
+    with open(course.yaml_paths[0]) as f:
+        mutations = yaml.safe_load(f)['mutations']
+    writers = []
+
+    def setup():
+        for writer in writers:
+            writer.abort()
+        writers[:] = [QuestionWriter(q_root)]
+        writers[0].materialize('tests/common', course.app_root, store)
+
+    try:
+        return timed(lambda: rspecFppGen.generate_variants(writers[0], mutations), repeat, setup)
+    finally:
+        for writer in writers:
+            writer.abort()
+
+
+def bench_common_tree(course, work: str, repeat: int) -> Dict[str, Dict[str, float]]:
+    store = os.path.join(work, 'store')
+    dest = os.path.join(work, 'common')
+
+    def cold():
+        rmtree(store, ignore_errors=True)
+        rmtree(dest, ignore_errors=True)
+        materialize._trees.clear()
+        materialize._verified.clear()
+
+    def warm():
+        rmtree(dest, ignore_errors=True)
+
+    run = lambda: materialize_tree(course.app_root, dest, store)
+    return { 'cold': timed(run, repeat, cold), 'warm': timed(run, repeat, warm) }
+
+
+def main():
+    parser = ArgumentParser(description='Benchmarks the generator stage by stage')
+    parser.add_argument('--output', default='bench_results.json', help='where to write the JSON results')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage')
+    parser.add_argument('--jobs', type=int, default=1, help='--jobs passed to rspecFppGen.main')
+    parser.add_argument('--keep', action='store_true', help='keep the synthetic course and its output')
+    add_course_args(parser)
+    args = parser.parse_args()
+
+    work = mkdtemp(prefix='fpp-bench-')
+    # never read or fill the user's own cache
+    os.environ['XDG_CACHE_HOME'] = os.path.join(work, 'cache')
+    try:
+        course = make_course(os.path.join(work, 'course'), questions=args.questions,
+                             mutations=args.mutations, files=args.files,
+                             size_kb=args.app_kb, seed=args.seed)
+        results = {
+            'python': python_version(),
+            'params': {
+                'questions': args.questions, 'mutations': args.mutations,
+                'files': args.files, 'app_kb': args.app_kb, 'jobs': args.jobs,
+            },
+            'stages': {
+                'main': bench_main(course, work, args.repeat, args.jobs),
+                'extract_regions': bench_extract_regions(course, args.repeat),
+                'generate_variants': bench_generate_variants(course, work, args.repeat),
+                'common_tree': bench_common_tree(course, work, args.repeat),
+            },
+        }
+    finally:
+        if args.keep:
+            print(f"Kept {work}")
+        else:
+            rmtree(work, ignore_errors=True)
+
+    with open(args.output, 'w') as f:
+        f.write(dumps(results, indent=2) + '\n')
+    print(dumps(results['stages'], indent=2))
+    print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+""" Generates a synthetic course shaped like the ones under examples/: an
+    application tree plus question YAMLs whose mutations apply cleanly to it.
+
+    usage: python -m benchmarks.synth <out dir> [--questions N] [--mutations M]
+                                      [--files F] [--app-kb K] [--seed S]
+"""
+from typing import *
+
+import os
+from argparse import ArgumentParser
+from random import Random
+
+import yaml
+
+# lines per synthetic ruby method, the first being its `def`
+METHOD_LINES: Final[int] = 6
+
+
+class SyntheticCourse(NamedTuple):
+    app_root: str
+    yaml_paths: List[str]
+    app_files: List[str]
+
+
+def method_lines(file_index: int, method_index: int) -> List[str]:
+    n = file_index * 1000 + method_index
+    return [
+        f"  def compute_{method_index}(input)",
+        f"    total = input + {n}",
+        f"    if total < {n * 2}",
+        f"      @status = :low",
+        f"    end",
+        f"  end",
+    ]
+
+
+def make_app(root: str, files: int, size_kb: int) -> List[str]:
+    """ Writes an app of `files` ruby sources totalling roughly `size_kb` KB under `root`,
+        laid out like a small rails app. Returns the relative paths of the sources.
+    """
+    os.makedirs(os.path.join(root, 'spec'), exist_ok=True)
+    with open(os.path.join(root, 'Gemfile'), 'w') as f:
+        f.write("source 'https://rubygems.org'\ngem 'rspec'\n")
+    with open(os.path.join(root, 'spec', 'app_spec.rb'), 'w') as f:
+        f.write("require 'spec_helper'\n")
+
+    per_method = sum(len(l) + 1 for l in method_lines(0, 0))
+    methods = max(1, size_kb * 1024 // max(1, files) // per_method)
+
+    app_files = []
+    for i in range(files):
+        kind = 'models' if i % 2 else 'controllers'
+        rel_path = f"app/{kind}/synthetic_{i}.rb"
+        os.makedirs(os.path.dirname(os.path.join(root, rel_path)), exist_ok=True)
+        lines = [f"class Synthetic{i}"]
+        for m in range(methods):
+            lines.extend(method_lines(i, m))
+        lines.append("end")
+        with open(os.path.join(root, rel_path), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        app_files.append(rel_path)
+    return app_files
+
+
+def make_mutation(rng: Random, app_root: str, rel_path: str) -> str:
+    """Returns a normal diff flipping the comparison of one method in `rel_path`"""
+    with open(os.path.join(app_root, rel_path)) as f:
+        lines = f.read().splitlines()
+    methods = (len(lines) - 2) // METHOD_LINES
+    # the comparison is the third line of each method, after the class line
+    line = 1 + rng.randrange(methods) * METHOD_LINES + 3
+    old = lines[line - 1]
+    return f"{line}c{line}\n< {old}\n---\n> {old.replace(' < ', ' >= ')}\n"
+
+
+def make_question(rng: Random, path: str, app_root: str, app_files: List[str], mutations: int) -> None:
+    question = {
+        'submit_to': 'spec/app_spec.rb',
+        'prompt': 'Write a test that catches every broken comparison.',
+        'solution': {
+            'pre': "describe Synthetic0 do\n",
+            'lines': "  it 'computes' do\n    ?expect?(Synthetic0.new.compute_0(1)).to ?eq?(nil)\n  end\n",
+            'post': "end\n",
+        },
+        'mutations': {
+            f"flip_{m}": {
+                'exclude': [],
+                'files': { f: make_mutation(rng, app_root, f) for f in rng.sample(app_files, min(2, len(app_files))) },
+            }
+            for m in range(mutations)
+        },
+    }
+    with open(path, 'w') as f:
+        yaml.safe_dump(question, f, sort_keys=False)
+
+
+def make_course(root: str, *,
+                questions: int = 10,
+                mutations: int = 5,
+                files: int = 20,
+                size_kb: int = 256,
+                seed: int = 0) -> SyntheticCourse:
+    """Writes an app under `root`/app and `questions` YAMLs under `root`/questions"""
+    rng = Random(seed)
+    app_root = os.path.join(root, 'app')
+    app_files = make_app(app_root, files, size_kb)
+
+    question_dir = os.path.join(root, 'questions')
+    os.makedirs(question_dir, exist_ok=True)
+    yaml_paths = []
+    for q in range(questions):
+        path = os.path.join(question_dir, f"synthetic_{q}.yaml")
+        make_question(rng, path, app_root, app_files, mutations)
+        yaml_paths.append(path)
+    return SyntheticCourse(app_root, yaml_paths, app_files)
+
+
+def add_course_args(parser: ArgumentParser) -> None:
+    parser.add_argument('--questions', type=int, default=10, help='question YAMLs to emit')
+    parser.add_argument('--mutations', type=int, default=5, help='mutations per question')
+    parser.add_argument('--files', type=int, default=20, help='ruby files in the app')
+    parser.add_argument('--app-kb', type=int, default=256, help='approximate size of the app sources')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def main():
+    parser = ArgumentParser(description='Generates a synthetic rspec fpp course')
+    parser.add_argument('out_dir')
+    add_course_args(parser)
+    args = parser.parse_args()
+
+    course = make_course(args.out_dir, questions=args.questions, mutations=args.mutations,
+                         files=args.files, size_kb=args.app_kb, seed=args.seed)
+    print(f"Wrote {len(course.yaml_paths)} questions over {len(course.app_files)} files in {course.app_root}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+from .api import BuildOptions, BuildResult, PreflightError, build_many, build_question, forget_app
+from .course import CourseError, QuestionSpec, load_course
+from .rspecFppGen import BuildError, MutationError, QuestionError
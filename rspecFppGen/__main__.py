@@ -0,0 +1,4 @@
+from .rspecFppGen import main
+
+if __name__ == "__main__":
+    main()
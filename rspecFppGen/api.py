@@ -0,0 +1,194 @@
+from typing import *
+
+import os
+from dataclasses import dataclass, field
+from threading import Lock
+from time import perf_counter
+
+from .cache import DiskCache
+from .course import QuestionSpec
+from .fingerprint import BuildManifest, question_fingerprint, tree_fingerprint
+from .materialize import STORE_DIR, forget_tree, prune_store, retain_paths
+from .rspecFppGen import BuildError, MutationError, Progress, QuestionError, _build_question, \
+    mutation_targets, name_clashes
+from .timing import TRACER
+
+if TYPE_CHECKING:
+    from .preflight import MutationFailure
+
+# builds into one destination share its manifest, store and question directories, so
+# they run one at a time, by real path; builds into different destinations run at once
+_DESTINATION_LOCKS: Final[Dict[str, Lock]] = dict()
+
+
+class PreflightError(MutationError):
+    """ Mutations of a batch that do not apply, found before anything was written.
+        `failures` holds each one with its place in the question YAML. Questions
+        that cannot be read, or are not valid YAML, raise a QuestionError instead.
+    """
+
+    def __init__(self, failures: List['MutationFailure']) -> None:
+        questions = len({ f.yaml_path for f in failures })
+        super().__init__(f"{len(failures)} broken mutation(s) in {questions} question(s): "
+                         + '; '.join(map(str, failures)))
+        self.failures = failures
+
+
+@dataclass
+class BuildOptions:
+    # threads patching the variants of each question (None: one per core)
+    variant_jobs: Optional[int] = None
+    # apply every mutation in memory before writing anything, as the command line does
+    preflight: bool = True
+    # rebuild questions whose YAML, application tree and tool are all unchanged
+    force: bool = False
+    # read and fill the on-disk caches (see cache.py)
+    cache: bool = True
+    # top-level fields the question of `build_question` gets unless its YAML sets them
+    # (the specs given to `build_many` carry their own)
+    defaults: Dict[str, Any] = field(default_factory=dict)
+    # called with each line of progress as a build reports it (it is kept in the result too)
+    progress: Optional[Callable[[str], None]] = None
+
+
+@dataclass
+class BuildResult:
+    name: str
+    yaml_path: str
+    # the question directory under the destination
+    path: str
+    # False if the question was skipped as unchanged since the last build
+    built: bool = False
+    # whether any file of the question changed
+    changed: bool = False
+    seconds: float = 0.0
+    # seconds spent in each stage of the build, by span name (see timing.py)
+    timings: Dict[str, float] = field(default_factory=dict)
+    # the trace spans recorded while building
+    trace: List[Dict[str, Any]] = field(default_factory=list)
+    # the progress the build reported, one step per line
+    log: str = ''
+    # why the question could not be built
+    error: Optional[BuildError] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class _CollectedProgress(Progress):
+    """Keeps the steps a build reports for its result, passing each on to `callback` too"""
+
+    def __init__(self, callback: Optional[Callable[[str], None]]) -> None:
+        self.lines: List[str] = []
+        self.callback = callback
+
+    def info(self, message: str) -> None:
+        self.lines.append(message)
+        if self.callback is not None:
+            self.callback(message)
+
+    warn = info
+
+
+def forget_app(app_root: str) -> None:
+    """ Drops the hashes of the application tree at `app_root` kept by this process,
+        so that the next build sees whatever changed in it since
+    """
+    forget_tree(app_root)
+    tree_fingerprint.cache_clear()
+
+
+def _check_mutations(specs: List[QuestionSpec]) -> None:
+    from .preflight import preflight
+
+    failures = preflight(specs)
+    malformed = [f for f in failures if f.malformed]
+    if malformed:
+        raise QuestionError(f"{len(malformed)} invalid question(s): " + '; '.join(map(str, malformed)))
+    if failures:
+        raise PreflightError(failures)
+
+
+def _build(spec: QuestionSpec, destination: str, options: BuildOptions, manifest: BuildManifest) -> BuildResult:
+    """ Builds one question, keeping the progress it reports and the trace spans it
+        records in its result, as well as any BuildError
+    """
+    result = BuildResult(spec.name, spec.yaml_path, os.path.join(destination, spec.name))
+    try:
+        fingerprint = question_fingerprint(spec.yaml_path, spec.app_root, spec.defaults)
+    except OSError as e:
+        result.error = QuestionError(f"cannot read {spec.yaml_path}: {e.strerror}")
+        return result
+    if not options.force and manifest.is_current(spec.name, fingerprint):
+        return result
+
+    progress = _CollectedProgress(options.progress)
+    start = perf_counter()
+    try:
+        manifest.forget(spec.name)
+        with TRACER.collect() as result.trace, TRACER.span("question", question=spec.name):
+            result.changed = _build_question(destination, spec, options.variant_jobs, progress=progress)
+        manifest.record(spec.name, fingerprint, spec.yaml_path)
+        result.built = True
+    except BuildError as e:
+        result.error = e
+    finally:
+        result.seconds = perf_counter() - start
+        result.log = ''.join(line + '\n' for line in progress.lines)
+        for event in result.trace:
+            result.timings[event['name']] = result.timings.get(event['name'], 0.0) + event['dur'] / 1e6
+    return result
+
+
+def build_question(yaml_path: str, app_root: str, destination: str, options: BuildOptions = None) -> BuildResult:
+    """ Builds the question at `yaml_path`, mutating the application at `app_root`,
+        into `destination`/<question name>, without printing or exiting.
+        Raises a QuestionError for an invalid question YAML, and a MutationError
+        (a PreflightError when `options.preflight`) for a mutation that does not apply.
+        The question's previous build is left untouched when one is raised.
+    """
+    options = options or BuildOptions()
+    result, = build_many([QuestionSpec(yaml_path, app_root, dict(options.defaults))], destination, options)
+    if result.error is not None:
+        raise result.error
+    return result
+
+
+def build_many(specs: Iterable[QuestionSpec], destination: str, options: BuildOptions = None) -> List[BuildResult]:
+    """ Builds each of `specs` (as listed by `course.load_course`, for instance) into
+        `destination` in turn, returning their results in the same order. A question
+        that cannot be built has its BuildError in its result, and the others go on.
+        Raises a PreflightError, before anything is written, if `options.preflight`
+        finds mutations that do not apply (a QuestionError if it finds a question
+        YAML it cannot read or parse), and a QuestionError if several questions
+        would be built under the same name.
+
+        Application trees are hashed once per process, so that later builds over the
+        same application start warm; call `forget_app` after changing one.
+
+        Nothing is printed, and the process's tracer and cache settings are left as
+        they are. Calls from several threads build at once, except into the same
+        destination: those wait for the one before to return.
+    """
+    options = options or BuildOptions()
+    specs = list(specs)
+    clashes = name_clashes(specs)
+    if clashes:
+        raise QuestionError(f"several questions share a name: {', '.join(clashes)}")
+
+    lock = _DESTINATION_LOCKS.setdefault(os.path.realpath(destination), Lock())
+    with lock, DiskCache.using(options.cache):
+        return _build_many(specs, destination, options)
+
+
+def _build_many(specs: List[QuestionSpec], destination: str, options: BuildOptions) -> List[BuildResult]:
+    for spec in specs:
+        retain_paths(spec.app_root, mutation_targets(spec.yaml_path))
+    if options.preflight:
+        _check_mutations(specs)
+
+    manifest = BuildManifest(destination)
+    results = [_build(spec, destination, options, manifest) for spec in specs]
+    prune_store(os.path.join(destination, STORE_DIR))
+    return results
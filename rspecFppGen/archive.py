@@ -0,0 +1,265 @@
+from typing import *
+
+import os
+import tarfile
+import zipfile
+from hashlib import sha256
+from io import BytesIO
+from json import loads
+from shutil import copyfileobj
+from stat import S_IFDIR, S_IFLNK, S_IFREG
+from threading import Lock
+from time import localtime, time
+
+from .materialize import CHUNK_SIZE, hash_file, hash_tree
+
+# archive suffixes and how each is written: a tarfile stream mode, 'zst' or 'zip'
+ARCHIVE_KINDS: Final[Dict[str, str]] = {
+    '.tar': 'w|',
+    '.tar.gz': 'w|gz', '.tgz': 'w|gz',
+    '.tar.bz2': 'w|bz2',
+    '.tar.xz': 'w|xz',
+    '.tar.zst': 'zst', '.tzst': 'zst',
+    '.zip': 'zip',
+}
+
+
+class ArchiveError(RuntimeError):
+    """Raised when an archive cannot be written in the format its name asks for"""
+
+
+def archive_kind(path: str) -> str:
+    for suffix, kind in ARCHIVE_KINDS.items():
+        if path.endswith(suffix):
+            return kind
+    raise ArchiveError(f"Cannot tell the format of {path}: expected a name ending in {', '.join(ARCHIVE_KINDS)}")
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ArchiveError("Zstandard archives need the optional `zstandard` package: pip install zstandard")
+    return zstandard
+
+
+def archive_uuids(path: str, prefix: str) -> Dict[str, str]:
+    """ Returns the uuid of each question in an earlier archive at `path`, so that
+        rebuilding the archive keeps them (PrairieLearn keys questions on them)
+    """
+    uuids = dict()
+
+    def record(name: str, data: bytes) -> None:
+        q_name = name[len(prefix):].split('/')[0] if name.startswith(prefix) else None
+        if q_name and name == f"{prefix}{q_name}/info.json":
+            try:
+                uuids[q_name] = loads(data).get("uuid")
+            except ValueError:
+                pass
+
+    try:
+        kind = archive_kind(path)
+        if kind == 'zip':
+            with zipfile.ZipFile(path) as zf:
+                for name in zf.namelist():
+                    if name.endswith('/info.json'):
+                        record(name, zf.read(name))
+            return uuids
+
+        with open(path, 'rb') as f:
+            fileobj = _zstandard().ZstdDecompressor().stream_reader(f) if kind == 'zst' else f
+            with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+                for member in tar:
+                    if member.isfile() and member.name.endswith('/info.json'):
+                        record(member.name, tar.extractfile(member).read())
+    except (OSError, ArchiveError, tarfile.TarError, zipfile.BadZipFile):
+        pass
+    return uuids
+
+
+class Archive:
+    """ A tar or zip file that questions are streamed into as they are produced,
+        instead of being written under a destination directory and packed later.
+
+        Members are named `prefix`/<question>/..., and tar members with the same
+        content and mode as an earlier one are stored as hardlinks to it. The
+        archive is written to a temporary sibling and moved into place by `close`,
+        so a failed build never leaves a partial archive behind.
+    """
+
+    def __init__(self, path: str, prefix: str = '') -> None:
+        self.path = path
+        self.kind = archive_kind(path)
+        prefix = os.path.normpath(prefix).lstrip('/')
+        self.prefix = '' if prefix in ('', '.') else prefix + '/'
+        self.uuids = archive_uuids(path, self.prefix) if os.path.exists(path) else dict()
+
+        self.mtime = int(time())
+        self.lock = Lock()
+        # first member holding each (digest, mode), for tar hardlinks
+        self.stored: Dict[Tuple[str, int], str] = dict()
+        self.files, self.links, self.bytes = 0, 0, 0
+        self.failed = False
+
+        self.tmp = f"{path}.{os.getpid()}.tmp"
+        self._file = open(self.tmp, 'wb')
+        self._zstd = None
+        self._tar: tarfile.TarFile = None
+        self._zip: zipfile.ZipFile = None
+        try:
+            if self.kind == 'zip':
+                self._zip = zipfile.ZipFile(self._file, 'w', zipfile.ZIP_DEFLATED)
+            elif self.kind == 'zst':
+                self._zstd = _zstandard().ZstdCompressor().stream_writer(self._file, closefd=False)
+                self._tar = tarfile.open(fileobj=self._zstd, mode='w|')
+            else:
+                self._tar = tarfile.open(fileobj=self._file, mode=self.kind)
+        except BaseException:
+            self._file.close()
+            os.unlink(self.tmp)
+            raise
+
+    def question(self, q_name: str) -> 'ArchiveWriter':
+        return ArchiveWriter(self, q_name)
+
+    def _tar_info(self, name: str, type: bytes, mode: int) -> tarfile.TarInfo:
+        info = tarfile.TarInfo(name)
+        info.type, info.mode, info.mtime = type, mode, self.mtime
+        return info
+
+    def _zip_info(self, name: str, mode: int) -> zipfile.ZipInfo:
+        info = zipfile.ZipInfo(name, localtime(self.mtime)[:6])
+        info.external_attr = mode << 16
+        info.compress_type = zipfile.ZIP_DEFLATED
+        return info
+
+    def add_dir(self, name: str) -> None:
+        name = self.prefix + name.rstrip('/')
+        with self.lock:
+            if self._zip:
+                info = self._zip_info(name + '/', S_IFDIR | 0o755)
+                info.external_attr |= 0x10  # MS-DOS directory flag
+                self._zip.writestr(info, b'')
+            else:
+                self._tar.addfile(self._tar_info(name, tarfile.DIRTYPE, 0o755))
+
+    def add_symlink(self, name: str, target: str) -> None:
+        name = self.prefix + name
+        with self.lock:
+            if self._zip:
+                self._zip.writestr(self._zip_info(name, S_IFLNK | 0o777), target)
+            else:
+                info = self._tar_info(name, tarfile.SYMTYPE, 0o777)
+                info.linkname = target
+                self._tar.addfile(info)
+
+    def add_file(self, name: str, data: BinaryIO, size: int, mode: int, digest: str) -> None:
+        """Streams `size` bytes of `data` in as `name`, or links it to an identical member"""
+        name = self.prefix + name
+        mode &= 0o777
+        with self.lock:
+            first = self.stored.setdefault((digest, mode), name)
+            if self._zip:
+                # zip has no hardlinks, so every copy is stored
+                info = self._zip_info(name, S_IFREG | mode)
+                info.file_size = size
+                with self._zip.open(info, 'w', force_zip64=size >= zipfile.ZIP64_LIMIT) as dst:
+                    copyfileobj(data, dst, CHUNK_SIZE)
+            elif first != name:
+                info = self._tar_info(name, tarfile.LNKTYPE, mode)
+                info.linkname = first
+                self._tar.addfile(info)
+                self.links += 1
+                return
+            else:
+                info = self._tar_info(name, tarfile.REGTYPE, mode)
+                info.size = size
+                self._tar.addfile(info, data)
+            self.files += 1
+            self.bytes += size
+
+    def close(self, ok: bool = True) -> bool:
+        """ Finishes the archive and moves it into place if `ok` and no question was
+            aborted, otherwise discards it. Returns whether the archive was kept.
+        """
+        keep = ok and not self.failed
+        try:
+            (self._zip or self._tar).close()
+            if self._zstd:
+                self._zstd.close()
+        finally:
+            self._file.close()
+        if keep:
+            os.replace(self.tmp, self.path)
+        else:
+            os.unlink(self.tmp)
+        return keep
+
+
+class ArchiveWriter:
+    """ Writes one question into an `Archive`, standing in for `output.QuestionWriter`
+        so that the build does not need to know where its output goes
+    """
+
+    def __init__(self, archive: Archive, q_name: str) -> None:
+        self.archive = archive
+        self.name = q_name
+        self.root = archive.prefix + q_name
+        # where each member streamed from disk came from, to read it back
+        self.sources: Dict[str, str] = dict()
+        self.bytes_written = 0
+
+    def _member(self, rel_path: str) -> str:
+        return f"{self.name}/{os.path.normpath(rel_path)}"
+
+    def read(self, rel_path: str) -> str:
+        if rel_path not in self.sources:
+            raise FileNotFoundError(f"{rel_path} was not written to {self.root}")
+        with open(self.sources[rel_path], 'r', newline='') as f:
+            return f.read()
+
+    def write(self, rel_path: str, content: Union[str, bytes]) -> int:
+        data = content.encode() if isinstance(content, str) else content
+        self.archive.add_file(self._member(rel_path), BytesIO(data), len(data), 0o644, sha256(data).hexdigest())
+        self.bytes_written += len(data)
+        return len(data)
+
+    def link(self, rel_path: str, src: str) -> None:
+        st = os.stat(src)
+        with open(src, 'rb') as f:
+            self.archive.add_file(self._member(rel_path), f, st.st_size, st.st_mode, hash_file(src))
+        self.sources[rel_path] = src
+        self.bytes_written += st.st_size
+
+    def symlink(self, rel_path: str, target: str) -> None:
+        self.archive.add_symlink(self._member(rel_path), target)
+
+    def mkdir(self, rel_path: str) -> None:
+        self.archive.add_dir(self._member(rel_path))
+
+    def materialize(self, rel_dir: str, root: str, store: str = None) -> int:
+        """ Streams the application tree at `root` in under `rel_dir`, reusing the
+            hashes already taken of it. Returns the number of files added.
+        """
+        files = 0
+        for rel_path, entry in hash_tree(root).items():
+            out_path = f"{rel_dir}/{rel_path}"
+            if rel_path.endswith('/'):
+                self.mkdir(out_path)
+            elif entry.link is not None:
+                self.symlink(out_path, entry.link)
+            else:
+                src = os.path.join(root, rel_path)
+                with open(src, 'rb') as f:
+                    self.archive.add_file(self._member(out_path), f, entry.size, entry.mode, entry.digest)
+                self.sources[out_path] = src
+                self.bytes_written += entry.size
+                files += 1
+        return files
+
+    def commit(self) -> bool:
+        return True
+
+    def abort(self) -> None:
+        """Members are already streamed, so the whole archive is discarded instead"""
+        self.archive.failed = True
@@ -0,0 +1,108 @@
+from typing import *
+
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from json import dumps, loads
+
+# bump to invalidate every entry written by an earlier layout or encoding
+CACHE_VERSION: Final[int] = 1
+
+# set by `DiskCache.using`, over `DiskCache.enabled`, for the context running it
+_enabled_here: ContextVar[Optional[bool]] = ContextVar('cache_enabled', default=None)
+
+
+def cache_root() -> str:
+    """The per-user cache directory, following the XDG base directory spec"""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'rspecFppGen')
+
+
+class DiskCache:
+    """ A directory of JSON values keyed by content hash, shared by every run (and
+        every worker process) of the generator. Entries are written atomically and
+        never change once written, so concurrent runs can share a cache safely.
+        Any entry that cannot be read is a miss, and any that cannot be written is
+        skipped: the cache only ever saves work.
+    """
+
+    # cleared by --no-cache; forked workers inherit it
+    enabled: ClassVar[bool] = True
+    # [hits, misses] of each namespace in this process, for the build summary
+    stats: ClassVar[Dict[str, List[int]]] = dict()
+
+    def __init__(self, namespace: str) -> None:
+        self.namespace = namespace
+        DiskCache.stats.setdefault(namespace, [0, 0])
+
+    @property
+    def dir(self) -> str:
+        return os.path.join(cache_root(), f"{self.namespace}-v{CACHE_VERSION}")
+
+    @staticmethod
+    def active() -> bool:
+        """Whether lookups in the calling context read and fill the cache"""
+        here = _enabled_here.get()
+        return DiskCache.enabled if here is None else here
+
+    @staticmethod
+    @contextmanager
+    def using(enabled: bool) -> Iterator[None]:
+        """Turns the cache on or off for the `with` block only, leaving other threads as they are"""
+        token = _enabled_here.set(enabled)
+        try:
+            yield
+        finally:
+            _enabled_here.reset(token)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        """The value stored under `key`, or None"""
+        if not DiskCache.active():
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                value = loads(f.read())
+        except (OSError, ValueError):
+            DiskCache.stats[self.namespace][1] += 1
+            return None
+        DiskCache.stats[self.namespace][0] += 1
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        if not DiskCache.active():
+            return
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, 'w') as f:
+                f.write(dumps(value, separators=(',', ':')))
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def drain_stats() -> Dict[str, List[int]]:
+        """Returns the lookups counted so far and starts counting afresh"""
+        stats = { ns: counts[:] for ns, counts in DiskCache.stats.items() }
+        for counts in DiskCache.stats.values():
+            counts[:] = [0, 0]
+        return stats
+
+    @staticmethod
+    def merge_stats(stats: Dict[str, List[int]]) -> None:
+        """Adds the lookups a worker process counted (see `drain_stats`) to this process's"""
+        for ns, (hits, misses) in stats.items():
+            counts = DiskCache.stats.setdefault(ns, [0, 0])
+            counts[0] += hits
+            counts[1] += misses
+
+    @staticmethod
+    def summary() -> Optional[str]:
+        """One line of the hits and misses of each cache looked up, or None if none was"""
+        used = [f"{ns} {hits} hits, {misses} misses" for ns, (hits, misses) in sorted(DiskCache.stats.items())
+                if hits + misses]
+        return f"Disk cache: {'; '.join(used)}" if used else None
@@ -150,3 +150,19 @@ PROGRAM_DESCRIPTION: Final[str] = Bcolors.f(Bcolors.OKGREEN, ' A tool for genera
      - They are formatted as `## import {rel_file_path} as {region name} ##`
         where `rel_file_path` is the relative path to the file from the source file
      - Like regular regions, they cannot be used inside of another region"""
+
+# bump alongside setup.py; part of every question's build fingerprint
+TOOL_VERSION: Final[str] = '0.1'
+
+# grader timeout model, in seconds: the grader starts once, then runs rspec against the
+# solution and each variant, copying the common tree (and the variant's files) every time
+GRADER_STARTUP_SECONDS: Final[float] = 10.0
+GRADER_SECONDS_PER_RUN: Final[float] = 6.0
+GRADER_SECONDS_PER_MB: Final[float] = 0.5
+GRADER_SECONDS_PER_MUTATED_FILE: Final[float] = 1.0
+# headroom over the estimate for a loaded grader host
+GRADER_TIMEOUT_SAFETY: Final[float] = 1.5
+# calibrated timeouts are rounded up to a multiple of the step and clamped to the bounds
+GRADER_TIMEOUT_STEP: Final[int] = 5
+GRADER_TIMEOUT_MIN: Final[int] = 30
+GRADER_TIMEOUT_MAX: Final[int] = 600
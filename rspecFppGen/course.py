@@ -0,0 +1,142 @@
+from typing import *
+
+import os
+from dataclasses import dataclass, field
+from glob import glob, has_magic
+from hashlib import sha256
+from json import dumps, loads
+
+from .cache import DiskCache
+
+# extensions a directory of questions is searched for
+QUESTION_EXTENSIONS: Final[Tuple[str, ...]] = ('.yaml', '.yml')
+
+
+class CourseError(RuntimeError):
+    """Raised when a course manifest or a list of question paths cannot be resolved"""
+
+
+def question_name(yaml_path: str) -> str:
+    yaml_file = os.path.basename(yaml_path)
+    return yaml_file[:yaml_file.index('.')]
+
+
+# parsed YAML documents, keyed by the hash of their text
+YAML_CACHE: Final[DiskCache] = DiskCache('yaml')
+
+
+def parse_yaml(data: bytes) -> Any:
+    """ Parses the YAML text `data` with libyaml's loader where it is installed, or
+        returns the document cached for the same text by an earlier run without
+        parsing (or even importing yaml). Raises a ValueError if `data` is invalid.
+    """
+    key = sha256(data).hexdigest()
+    cached = YAML_CACHE.get(key)
+    if cached is not None:
+        return cached['document']
+
+    import yaml
+    try:
+        document = yaml.load(data, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+    except yaml.YAMLError as e:
+        raise ValueError(f"invalid YAML: {e}") from e
+    # documents JSON cannot hold exactly (dates, non-string keys) are parsed every time
+    try:
+        if loads(dumps(document)) == document:
+            YAML_CACHE.put(key, { 'document': document })
+    except (TypeError, ValueError):
+        pass
+    return document
+
+
+def load_yaml(path: str) -> Any:
+    """Reads and parses the YAML file at `path`, as `parse_yaml`"""
+    with open(path, 'rb') as f:
+        return parse_yaml(f.read())
+
+
+@dataclass
+class QuestionSpec:
+    """One question to build: its YAML, the application it mutates and the fields it defaults"""
+    yaml_path: str
+    app_root: str
+    # top-level fields the question gets unless its own YAML sets them
+    defaults: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def name(self) -> str:
+        return question_name(self.yaml_path)
+
+
+def expand_yaml_paths(patterns: List[str], base: str = '') -> List[str]:
+    """ Expands each of `patterns` (relative to `base`) into question YAMLs: a file is
+        taken as is, a directory stands for the YAMLs directly inside it, and anything
+        else is a glob (`**` recurses). Paths are returned once each, in the order given.
+    """
+    paths: List[str] = []
+    seen: Set[str] = set()
+    for pattern in patterns:
+        full = os.path.join(base, pattern)
+        if os.path.isdir(full):
+            found = sorted(p for ext in QUESTION_EXTENSIONS for p in glob(os.path.join(full, f"*{ext}")))
+        elif has_magic(full):
+            found = sorted(p for p in glob(full, recursive=True) if os.path.isfile(p))
+        elif os.path.isfile(full):
+            found = [full]
+        else:
+            raise CourseError(f"No such question YAML: {full}")
+        if not found:
+            raise CourseError(f"{full} matches no question YAML")
+        for p in found:
+            if p not in seen:
+                seen.add(p)
+                paths.append(p)
+    return paths
+
+
+def _defaults(data: Any, where: str) -> Dict[str, Any]:
+    if data is None:
+        return dict()
+    if not isinstance(data, dict):
+        raise CourseError(f"`defaults:` of {where} must be a mapping of question fields")
+    if 'mutations' in data:
+        raise CourseError(f"`defaults:` of {where} cannot set `mutations:`, each question lists its own")
+    return data
+
+
+def load_course(path: str) -> List[QuestionSpec]:
+    """ Reads a course manifest listing the questions of each application, as in
+
+            defaults:                 # fields every question gets unless it sets them
+              submit_to: spec/app_spec.rb
+            apps:
+              - root: giftcard/app
+                defaults: { ... }     # over the course defaults, for this app only
+                questions: [giftcard/gift_card_1.yaml, giftcard/more/, "giftcard/**/*.yaml"]
+
+        Paths are relative to the manifest. Returns a QuestionSpec per question.
+    """
+    try:
+        course = load_yaml(path)
+    except (OSError, ValueError) as e:
+        raise CourseError(f"Cannot read course manifest {path}: {e}")
+    if not isinstance(course, dict) or not isinstance(course.get('apps'), list):
+        raise CourseError(f"Course manifest {path} must have an `apps:` list")
+
+    base = os.path.dirname(path)
+    course_defaults = _defaults(course.get('defaults'), path)
+    specs: List[QuestionSpec] = []
+    for i, app in enumerate(course['apps'], 1):
+        where = f"app #{i} of {path}"
+        if not isinstance(app, dict) or 'root' not in app or not app.get('questions'):
+            raise CourseError(f"{where} needs a `root:` and a list of `questions:`")
+        root = os.path.join(base, app['root'])
+        if not os.path.isdir(root):
+            raise CourseError(f"{where}: application root {root} is not a directory")
+        questions = app['questions'] if isinstance(app['questions'], list) else [app['questions']]
+        defaults = { **course_defaults, **_defaults(app.get('defaults'), where) }
+        for yaml_path in expand_yaml_paths(list(map(str, questions)), base):
+            # a manifest kept among its questions is not one of them
+            if os.path.realpath(yaml_path) != os.path.realpath(path):
+                specs.append(QuestionSpec(yaml_path, root, defaults))
+    return specs
@@ -0,0 +1,87 @@
+from typing import *
+
+import os
+from functools import lru_cache
+from hashlib import sha256
+from json import dumps, loads
+
+from .consts import TOOL_VERSION
+from .materialize import hash_tree
+
+# build manifest kept inside the destination directory
+MANIFEST_FILE: Final[str] = '.fpp_manifest.json'
+
+
+@lru_cache(maxsize=None)
+def tool_fingerprint() -> str:
+    """ Hashes the tool version and the generator's own sources, so that
+        upgrading (or editing) the tool invalidates every question
+    """
+    h = sha256(TOOL_VERSION.encode())
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(package_dir)):
+        if name.endswith('.py'):
+            with open(os.path.join(package_dir, name), 'rb') as f:
+                h.update(name.encode())
+                h.update(f.read())
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def tree_fingerprint(root: str) -> str:
+    """Hashes the paths, modes and contents of the application tree at `root`"""
+    h = sha256()
+    # sorted, since a tree refreshed in watch mode lists its changed entries last
+    for rel_path, entry in sorted(hash_tree(root).items()):
+        h.update(f"{rel_path}\0{entry.mode:o}\0{entry.link or entry.digest}\n".encode())
+    return h.hexdigest()
+
+
+def question_fingerprint(yaml_path: str, common: str, defaults: Dict[str, Any] = None) -> str:
+    """Fingerprints everything a question's output depends on"""
+    h = sha256()
+    with open(yaml_path, 'rb') as f:
+        h.update(f.read())
+    if defaults:
+        h.update(dumps(defaults, sort_keys=True, default=str).encode())
+    h.update(tree_fingerprint(common).encode())
+    h.update(tool_fingerprint().encode())
+    return h.hexdigest()
+
+
+class BuildManifest:
+    """ Records the fingerprint each question in a destination was last built
+        from, so that unchanged questions can be skipped
+    """
+
+    def __init__(self, destination: str) -> None:
+        self.destination = destination
+        self.path = os.path.join(destination, MANIFEST_FILE)
+        self.questions: Dict[str, Dict[str, str]] = dict()
+        try:
+            with open(self.path, 'r') as f:
+                self.questions = loads(f.read()).get('questions', {})
+        except (OSError, ValueError):
+            # a missing or corrupt manifest just means everything is rebuilt
+            pass
+
+    def is_current(self, q_name: str, fingerprint: str) -> bool:
+        """Whether `q_name` was built from `fingerprint` and its output still exists"""
+        entry = self.questions.get(q_name)
+        return bool(entry) and entry['fingerprint'] == fingerprint \
+            and os.path.isdir(os.path.join(self.destination, q_name))
+
+    def record(self, q_name: str, fingerprint: str, yaml_path: str) -> None:
+        self.questions[q_name] = { 'fingerprint': fingerprint, 'yaml': yaml_path }
+        self.save()
+
+    def forget(self, q_name: str) -> None:
+        if self.questions.pop(q_name, None) is not None:
+            self.save()
+
+    def save(self) -> None:
+        os.makedirs(self.destination, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(dumps({ 'version': TOOL_VERSION, 'questions': self.questions }, indent=2, sort_keys=True))
+        os.replace(tmp, self.path)
@@ -5,22 +5,35 @@ from json import dumps, loads
 from json.decoder import JSONDecodeError
 from os import path
 from re import finditer, match as test
-from shutil import copyfile
 from uuid import uuid4
 from functools import partial
 
-from consts import MAIN_PATTERN, SPECIAL_COMMENT_PATTERN, \
-    BLANK_SUBSTITUTE, SETUP_CODE_DEFAULT, TEST_DEFAULT, REGION_IMPORT_PATTERN
-from name_visitor import generate_server, AnnotatedName
-from io_helpers import Bcolors, resolve_path, file_name, \
+from .cache import DiskCache
+from .consts import MAIN_PATTERN, SPECIAL_COMMENT_PATTERN, \
+    BLANK_SUBSTITUTE, SETUP_CODE_DEFAULT, SERVER_DEFAULT, TEST_DEFAULT, REGION_IMPORT_PATTERN
+from .output import copy_if_changed
+from .io_helpers import Bcolors, resolve_path, file_name, \
     make_if_absent, write_to, file_ext, Namespace, parse_args, \
-    auto_detect_sources, read_region_source_lines
+    auto_detect_sources, read_region_source_lines, RegionImport, FILE_CACHE
+
+# name_visitor (and with it `ast`) is only loaded when a question's code is analysed
+if TYPE_CHECKING:
+    from .name_visitor import AnnotatedName
+
+
+def analyse(setup_code: str, answer_code: str, no_parse: bool) -> Tuple[str, List['AnnotatedName'], List['AnnotatedName']]:
+    """`name_visitor.generate_server`, without importing it when `no_parse` skips the analysis"""
+    if no_parse:
+        return SERVER_DEFAULT, [], []
+    from .name_visitor import generate_server
+    return generate_server(setup_code, answer_code)
 
 
 def extract_regions(
         source_code: str, *,
         keep_comments_in_prompt: bool = False,
-        source_path: str = None) -> Dict[str, str]:
+        source_path: str = None,
+        lazy_imports: bool = False) -> Dict[str, Union[str, RegionImport]]:
     """ Extracts from well-formatted `source_code` string the text for the question, 
         the problem starting code, the answer code, and any other custom regions
 
@@ -52,6 +65,8 @@ def extract_regions(
             - They are formatted as `## import {rel_file_path} as {region name} ##`
                 where `rel_file_path` is the relative path to the file from the source file
             - Like regular regions, they cannot be used inside of another region
+            - If `lazy_imports = True`, a region made up of a single import is
+              returned as a `RegionImport`, so the file can be streamed instead of read
 
 
         e.g.
@@ -74,9 +89,11 @@ def extract_regions(
 
     format_line = partial('({}:{})'.format, source_path or 'line')
 
-    # accumulators
+    # accumulators: each region collects a list of chunks, joined once at the end,
+    # so that large regions don't cost quadratic time in repeated concatenation
     line_number = 1
-    regions = defaultdict(str)
+    chunks = defaultdict(list)
+    prompt_chunks, answer_chunks = chunks['prompt_code'], chunks['answer_code']
 
     for match in finditer(MAIN_PATTERN, source_code):
         start, end = match.span()
@@ -84,12 +101,12 @@ def extract_regions(
         # (if no uncaptured text exists, unmatched = '')
         unmatched = source_code[last_end:start]
         if current_region:
-            regions[current_region.id] += unmatched
+            chunks[current_region.id].append(unmatched)
         else:
-            regions['prompt_code'] += unmatched
-            regions['answer_code'] += unmatched
+            prompt_chunks.append(unmatched)
+            answer_chunks.append(unmatched)
         # keep the line number updated
-        line_number += sum(1 for x in unmatched if x == '\n')
+        line_number += unmatched.count('\n')
 
         last_end = end
 
@@ -116,8 +133,11 @@ def extract_regions(
                 if import_region:
                     region_source, alias = import_region.groups()
                     try:
-                        regions[alias] += read_region_source_lines(
-                            source_path, region_source)
+                        if lazy_imports:
+                            chunks[alias].append(RegionImport(source_path, region_source))
+                        else:
+                            chunks[alias].append(read_region_source_lines(
+                                source_path, region_source))
                     except FileNotFoundError:
                         raise FileNotFoundError(
                             "Region \"{}\" failed on import. Could not find {} at {}".format(
@@ -129,39 +149,39 @@ def extract_regions(
                 else:
                     current_region = RegionToken(line_number + 1, region_delim)
         elif current_region:
-            regions[current_region.id] += next(filter(bool, match.groups()))
+            chunks[current_region.id].append(next(filter(bool, match.groups())))
         elif comment:
             special_comment = test(SPECIAL_COMMENT_PATTERN, comment)
 
             if not special_comment:
-                regions['answer_code'] += comment
+                answer_chunks.append(comment)
 
             if special_comment or keep_comments_in_prompt:
                 # even if excluding the comment from the prompt,
                 # every comment ends with a '\n'.
                 # must keep it to maintain whitespacing
-                regions['prompt_code'] += comment
+                prompt_chunks.append(comment)
         elif docstring:
             if first_match:
                 # isolate the question doc and save it
-                regions['question_text'] += docstring[3:-3]
+                chunks['question_text'].append(docstring[3:-3])
             else:
                 # docstrings cannot be included in current FPP
-                # regions['prompt_code'] += docstring
-                regions['answer_code'] += docstring
+                # prompt_chunks.append(docstring)
+                answer_chunks.append(docstring)
         elif string:
             # strings always stay in both
-            regions['prompt_code'] += string
-            regions['answer_code'] += string
+            prompt_chunks.append(string)
+            answer_chunks.append(string)
         elif blank_ans:
             # fill in proper blank text
-            regions['prompt_code'] += BLANK_SUBSTITUTE
-            regions['answer_code'] += blank_ans
+            prompt_chunks.append(BLANK_SUBSTITUTE)
+            answer_chunks.append(blank_ans)
         else:
             raise Exception('All capture groups are None after', last_end)
         # keep track of any \n in the matched part of the string
         # (namely for docstrings or region delimiters)
-        line_number += sum(1 for x in source_code[start:end] if x == '\n')
+        line_number += source_code.count('\n', start, end)
         first_match = False
 
     # all region delimiters should've been detected.
@@ -172,8 +192,15 @@ def extract_regions(
 
     # don't forget everything after the last match!
     unmatched = source_code[last_end:]
-    regions['prompt_code'] += unmatched
-    regions['answer_code'] += unmatched
+    prompt_chunks.append(unmatched)
+    answer_chunks.append(unmatched)
+
+    def join_chunks(v: list) -> Union[str, RegionImport]:
+        if len(v) == 1 and isinstance(v[0], RegionImport):
+            return v[0]
+        return ''.join(c.read() if isinstance(c, RegionImport) else c for c in v)
+
+    regions = defaultdict(str, ((k, join_chunks(v)) for k, v in chunks.items()))
 
     # remove all whitespace-only lines
     # usually as a result of removing comments
@@ -193,8 +220,8 @@ def generate_question_html(
     prompt_code: Dict[str, str], *,
     question_text: str = None,
     tab: str = '  ',
-    setup_names: List[AnnotatedName] = None,
-    answer_names: List[AnnotatedName] = None
+    setup_names: List['AnnotatedName'] = None,
+    answer_names: List['AnnotatedName'] = None
 ) -> str:
     """Turn an extracted prompt string into a question html file body"""
     indented = prompt_code['lines'].replace('\n', '\n' + tab)
@@ -206,7 +233,7 @@ def generate_question_html(
 
         question_text += '\n\n<markdown>\n'
 
-        def format_annotated_name(name: AnnotatedName) -> str:
+        def format_annotated_name(name: 'AnnotatedName') -> str:
             out = ' - `' + name.id
             if name.annotation:
                 out += ': ' + name.annotation
@@ -306,13 +333,13 @@ def generate_fpp_question(
 
     with open(source_path, 'r') as source:
         source_code = ''.join(source)
-        regions = extract_regions(source_code, source_path=source_path)
+        regions = extract_regions(source_code, source_path=source_path, lazy_imports=True)
 
     def remove_region(key, default=''):
         if key in regions:
             v = regions[key]
             del regions[key]
-            return v
+            return v.read() if isinstance(v, RegionImport) else v
         return default
 
     question_name = file_name(source_path)
@@ -329,7 +356,7 @@ def generate_fpp_question(
     copy_dest_path = path.join(question_dir, 'source.py')
     if log_details:
         print('- Copying {} to {} ...'.format(path.basename(source_path), copy_dest_path))
-    copyfile(source_path, copy_dest_path)
+    copy_if_changed(source_path, copy_dest_path)
 
     if log_details:
         print('- Populating {} ...'.format(question_dir))
@@ -342,8 +369,8 @@ def generate_fpp_question(
         pass
 
     server_code = remove_region('server')
-    gen_server_code, setup_names, answer_names = generate_server(
-        setup_code, answer_code, no_ast=no_parse)
+    gen_server_code, setup_names, answer_names = analyse(
+        setup_code, answer_code, no_parse)
     server_code = server_code or gen_server_code
 
     prompt_code = remove_region('prompt_code')
@@ -403,8 +430,53 @@ def generate_fpp_question(
         make_if_absent(path.dirname(final_path))
         Bcolors.warn('  -', final_path, '...')
 
-        # write files
-        write_to(question_dir, raw_path, data)
+        # write files, streaming imported ones straight from their source
+        if isinstance(data, RegionImport):
+            data.copy_to(question_dir, raw_path)
+        else:
+            write_to(question_dir, raw_path, data)
+
+
+def generate_fpp_files(
+    question_text: str,
+    solution: Dict[str, str], *,
+    source_code: str = None,
+    no_parse: bool = False,
+    show_required: bool = False
+) -> Dict[str, str]:
+    """ In-memory counterpart of `generate_fpp_question` for an already-parsed question,
+        where `solution` holds the `pre`, `lines` and `post` of a vertical problem.
+        Returns the contents of each generated file, keyed by its path relative to
+        the question directory. If `source_code` is given, it is kept as source.py.
+    """
+    setup_code = SETUP_CODE_DEFAULT
+    answer_code = solution['lines']
+    server_code, setup_names, answer_names = analyse(
+        setup_code, answer_code, no_parse)
+
+    prompt_code = dict(solution)
+    prompt_code.update({
+        'format' : 'vertical',
+        'lines' : extract_regions(solution['lines']).get('prompt_code')
+    })
+
+    question_html = generate_question_html(
+        prompt_code,
+        question_text=question_text,
+        setup_names=setup_names,
+        answer_names=answer_names if show_required else None
+    )
+
+    files = {
+        'question.html': question_html,
+        'server.py': server_code,
+        path.join('tests', 'ans.py'): answer_code,
+        path.join('tests', 'setup_code.py'): setup_code,
+        path.join('tests', 'test.py'): TEST_DEFAULT,
+    }
+    if source_code is not None:
+        files['source.py'] = source_code
+    return files
 
 
 def generate_many(args: Namespace):
@@ -453,6 +525,13 @@ def generate_many(args: Namespace):
         else:
             Bcolors.fail('Batch failed on all', n_files(failures))
 
+        stats = FILE_CACHE.stats()
+        if stats['hits'] + stats['misses']:
+            print('Import cache: {hits} hits, {misses} misses ({bytes} bytes held)'.format(**stats))
+        cache_summary = DiskCache.summary()
+        if cache_summary:
+            print(cache_summary)
+
 def profile_generate_many(args: Namespace):
     from cProfile import Profile
     from pstats import Stats, SortKey
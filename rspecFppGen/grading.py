@@ -0,0 +1,54 @@
+from typing import *
+
+from math import ceil
+
+from .consts import GRADER_STARTUP_SECONDS, GRADER_SECONDS_PER_RUN, GRADER_SECONDS_PER_MB, \
+    GRADER_SECONDS_PER_MUTATED_FILE, GRADER_TIMEOUT_SAFETY, GRADER_TIMEOUT_STEP, \
+    GRADER_TIMEOUT_MIN, GRADER_TIMEOUT_MAX
+
+
+class GradingCost(NamedTuple):
+    """What grading one submission of a question costs, for calibrating its timeout"""
+    variants: int
+    # files written over the common tree, summed over the variants
+    mutated_files: int
+    common_files: int
+    common_bytes: int
+    # the question's own `timeout:`, which wins over the estimate
+    override: Optional[int] = None
+
+    @property
+    def runs(self) -> int:
+        # the student's tests run against the solution and then against every variant
+        return 1 + self.variants
+
+    @property
+    def estimate(self) -> float:
+        """Seconds grading should take, by the model in consts"""
+        mb = self.common_bytes / (1 << 20)
+        return GRADER_STARTUP_SECONDS \
+            + self.runs * (GRADER_SECONDS_PER_RUN + mb * GRADER_SECONDS_PER_MB) \
+            + self.mutated_files * GRADER_SECONDS_PER_MUTATED_FILE
+
+    @property
+    def timeout(self) -> int:
+        """The grader timeout to configure: the override, or the estimate with headroom"""
+        if self.override is not None:
+            return self.override
+        steps = ceil(self.estimate * GRADER_TIMEOUT_SAFETY / GRADER_TIMEOUT_STEP)
+        return min(max(steps * GRADER_TIMEOUT_STEP, GRADER_TIMEOUT_MIN), GRADER_TIMEOUT_MAX)
+
+    def __str__(self) -> str:
+        source = "set by `timeout:`" if self.override is not None else "calibrated"
+        return f"{self.runs} rspec runs over {self.common_files} common files " \
+               f"({self.common_bytes / (1 << 20):.2f} MB) with {self.mutated_files} mutated files, " \
+               f"estimated {self.estimate:.0f}s: timeout {self.timeout}s ({source})"
+
+
+def timeout_override(value: Any) -> Optional[int]:
+    """Validates a question's `timeout:` field, raising a ValueError if it is not a positive number of seconds"""
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError(f"`timeout:` must be a positive number of seconds, not {value!r}")
+    return ceil(value)
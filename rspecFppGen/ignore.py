@@ -0,0 +1,112 @@
+from typing import *
+
+import os
+from re import compile, escape, Pattern
+
+# read from the root of an application tree, in gitignore syntax
+IGNORE_FILE: Final[str] = '.fppignore'
+
+# rules applied before those of the IGNORE_FILE, which can undo them with `!`:
+# installed gems, compiled extensions, cached gem archives, logs and temporary files
+DEFAULT_RULES: Final[Tuple[str, ...]] = (
+    '/vendor/bundle/',
+    '*.o',
+    '*.so',
+    '*.gem',
+    '/log/',
+    '/tmp/',
+)
+
+
+def _translate(glob: str) -> str:
+    """Translates the body of a gitignore pattern into a regular expression"""
+    regex, i = '', 0
+    while i < len(glob):
+        if glob.startswith('**/', i) and (i == 0 or glob[i - 1] == '/'):
+            # any number of leading directories, including none
+            regex += '(?:.*/)?'
+            i += 3
+        elif glob.startswith('**', i) and (i == 0 or glob[i - 1] == '/') and i + 2 == len(glob):
+            regex += '.*'
+            i += 2
+        elif glob[i] == '*':
+            regex += '[^/]*'
+            i += 1
+        elif glob[i] == '?':
+            regex += '[^/]'
+            i += 1
+        elif glob[i] == '[' and ']' in glob[i + 2:]:
+            end = glob.index(']', i + 2)
+            body = glob[i + 1:end]
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            regex += '[' + body.replace('\\', '\\\\') + ']'
+            i = end + 1
+        elif glob[i] == '\\' and i + 1 < len(glob):
+            regex += escape(glob[i + 1])
+            i += 2
+        else:
+            regex += escape(glob[i])
+            i += 1
+    return regex
+
+
+class IgnoreRule(NamedTuple):
+    pattern: Pattern
+    # a `!` rule includes what earlier rules excluded
+    negated: bool
+    # a rule ending in `/` only matches directories
+    dir_only: bool
+
+
+def parse_rule(line: str) -> Optional[IgnoreRule]:
+    """Parses one line of a gitignore file, returning None for blanks and comments"""
+    line = line.rstrip('\r\n')
+    if not line.endswith('\\ '):
+        line = line.rstrip()
+    if not line or line.startswith('#'):
+        return None
+    negated = line.startswith('!')
+    if negated or line.startswith(('\\!', '\\#')):
+        line = line[1:]
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+    # a slash anywhere but the end anchors the pattern to the root
+    anchored = '/' in line
+    regex = _translate(line.lstrip('/'))
+    return IgnoreRule(compile(('^' if anchored else '^(?:.*/)?') + regex + '$'), negated, dir_only)
+
+
+class IgnoreRules:
+    """ The ignore rules of an application tree: the DEFAULT_RULES followed by those
+        of its IGNORE_FILE. As in git, the last rule matching a path decides it, and
+        nothing under an ignored directory is included.
+    """
+
+    def __init__(self, lines: Iterable[str] = ()) -> None:
+        self.rules: List[IgnoreRule] = [r for r in map(parse_rule, [*DEFAULT_RULES, *lines]) if r]
+
+    @staticmethod
+    def load(root: str) -> 'IgnoreRules':
+        try:
+            with open(os.path.join(root, IGNORE_FILE), 'r') as f:
+                return IgnoreRules(f.read().splitlines())
+        except FileNotFoundError:
+            return IgnoreRules()
+
+    def ignored(self, rel_path: str, is_dir: bool) -> bool:
+        """Whether the rules themselves ignore `rel_path`, leaving aside its parents"""
+        rel_path = rel_path.strip('/')
+        ignored = False
+        for rule in self.rules:
+            if rule.negated == ignored and (is_dir or not rule.dir_only) and rule.pattern.match(rel_path):
+                ignored = not rule.negated
+        return ignored
+
+    def excluded(self, rel_path: str, is_dir: bool) -> bool:
+        """Whether `rel_path` is left out of the tree, by its own rules or a parent's"""
+        parts = rel_path.strip('/').split('/')
+        return any(self.ignored('/'.join(parts[:i]), True) for i in range(1, len(parts))) \
+            or self.ignored(rel_path, is_dir)
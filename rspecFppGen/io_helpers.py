@@ -1,13 +1,15 @@
-from os import getcwd, listdir, makedirs
+from os import getcwd, listdir, makedirs, stat
 from argparse import *
 from os.path import *
 from typing import *
 
+from collections import OrderedDict
 from functools import partial
 
 
 
-from consts import Bcolors, PROGRAM_DESCRIPTION
+from .consts import Bcolors, PROGRAM_DESCRIPTION
+from .output import copy_if_changed, write_if_changed
 
 
 def file_name(file_path) -> AnyStr:
@@ -21,9 +23,8 @@ def file_ext(file_path) -> AnyStr:
 
 
 def write_to(parent_dir, file_path, data: str):
-    """Opens ./`parent_dir`/`file_path` and writes `data` to it"""
-    with open(join(parent_dir, file_path), 'w+') as f:
-        f.write(data)
+    """Writes `data` to ./`parent_dir`/`file_path`, unless the file already holds exactly that"""
+    write_if_changed(join(parent_dir, file_path), data)
 
 
 def make_if_absent(dir_path: str):
@@ -33,20 +34,119 @@ def make_if_absent(dir_path: str):
     makedirs(dir_path, exist_ok=True)
 
 
+class FileCache:
+    """ A run-scoped cache of file contents, keyed by absolute path and checked
+        against each file's mtime and size, holding at most `max_bytes` of text
+        (least recently used files are evicted first). Also remembers where
+        relative paths were resolved to.
+    """
+
+    def __init__(self, max_bytes: int = 64 << 20) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: OrderedDict = OrderedDict()
+        self.resolved: Dict[tuple, str] = dict()
+        self.hits = self.misses = 0
+        self.path_hits = self.path_misses = 0
+
+    def read(self, path: str) -> str:
+        """Returns the text of `path`, reading it only if it is not cached or has changed"""
+        key = abspath(path)
+        st = stat(key)  # may raise OSError
+        stamp = (st.st_mtime_ns, st.st_size)
+
+        entry = self.entries.get(key)
+        if entry and entry[0] == stamp:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1]
+
+        self.misses += 1
+        with open(key, 'r') as f:
+            text = f.read()
+
+        if entry:
+            self.size -= entry[0][1]
+            del self.entries[key]
+        if st.st_size <= self.max_bytes:
+            self.entries[key] = (stamp, text)
+            self.size += st.st_size
+            while self.size > self.max_bytes:
+                _, ((_, evicted), _) = self.entries.popitem(last=False)
+                self.size -= evicted
+        return text
+
+    def resolve(self, key: tuple, resolver: Callable[[], str]) -> str:
+        """ Returns the path `resolver` found for `key` last time if it still exists,
+            otherwise calls `resolver` (which may raise) and remembers its result
+        """
+        key = (getcwd(),) + key
+        path = self.resolved.get(key)
+        if path is not None and exists(path):
+            self.path_hits += 1
+            return path
+
+        self.path_misses += 1
+        path = self.resolved[key] = resolver()
+        return path
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits, 'misses': self.misses, 'bytes': self.size,
+            'path_hits': self.path_hits, 'path_misses': self.path_misses,
+        }
+
+
+# shared by every question generated in this run
+FILE_CACHE: Final[FileCache] = FileCache()
+
+
+def resolve_region_source(source_path: str, region_source: str) -> str:
+    """ Returns the path to `region_source`, or raises a FileNotFoundError.
+
+        Searches in ./ and ./`source_path`/ for `region_source`
+    """
+    def resolve() -> str:
+        path = region_source
+        if not exists(path):
+            path = join(dirname(source_path), path)
+
+        if not exists(path):
+            raise FileNotFoundError(region_source)
+
+        return path
+
+    return FILE_CACHE.resolve(('region', source_path, region_source), resolve)
+
+
 def read_region_source_lines(source_path: str, region_source: str) -> str:
     """ Reads the region_source and returns its contents, or raises
         a FileNotFoundError or other OSError in opening the file.
 
         Searches in ./ and ./`source_path`/ for `region_source`
     """
-    if not exists(region_source):
-        region_source = join(dirname(source_path), region_source)
+    return FILE_CACHE.read(resolve_region_source(source_path, region_source))  # may raise OSError
+
+
+class RegionImport:
+    """ A region whose only content is an imported file. The file is never held
+        in memory unless the region's text is needed: when written verbatim, it
+        is streamed to its destination in fixed-size chunks.
+    """
+
+    def __init__(self, source_path: str, region_source: str) -> None:
+        self.path = resolve_region_source(source_path, region_source)
+        # surface unreadable files where the import is declared, as reading would
+        with open(self.path, 'r'):  # may raise OSError
+            pass
 
-    if not exists(region_source):
-        raise FileNotFoundError(region_source)
+    def read(self) -> str:
+        return FILE_CACHE.read(self.path)
 
-    with open(region_source, 'r') as f:  # may raise OSError
-        return ''.join(f.readlines())
+    def copy_to(self, parent_dir: str, file_path: str) -> None:
+        """Streams the imported file to ./`parent_dir`/`file_path`, unless it is already there"""
+        # in text mode, as the region's text would be read and written
+        copy_if_changed(self.path, join(parent_dir, file_path), text=True)
 
 
 def auto_detect_sources(questions_dir = None) -> List:
@@ -86,7 +186,15 @@ def resolve_path(path: str, *,
         |
         ```
         Will search ./questions/ 4th, in case this is run from <course>/
+
+        Resolved paths are remembered for the rest of the run.
     """
+    return FILE_CACHE.resolve(
+        ('path', path, path_is_dir),
+        partial(_resolve_path, path, silent=silent, path_is_dir=path_is_dir))
+
+
+def _resolve_path(path: str, *, silent: bool, path_is_dir: bool) -> str:
     if not path_is_dir and (isdir(path) or not file_ext(path)):
         path += '.py'
 
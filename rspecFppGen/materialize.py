@@ -0,0 +1,367 @@
+from typing import *
+
+import os
+from hashlib import sha256
+from shutil import copyfile, copymode, rmtree
+from time import time
+
+from .ignore import IGNORE_FILE, IgnoreRules
+
+CHUNK_SIZE: Final[int] = 1 << 20
+
+# name of the content-addressed store kept inside the destination directory
+STORE_DIR: Final[str] = '.fpp_store'
+
+# linux ioctl that asks the filesystem for a copy-on-write clone
+FICLONE: Final[int] = 0x40049409
+
+# objects nothing references are only pruned once nothing has linked (or added) them
+# for this long, so that a concurrent build into the same destination keeps its own
+PRUNE_GRACE_SECONDS: Final[int] = 600
+
+
+class TreeEntry(NamedTuple):
+    digest: str
+    mode: int
+    size: int
+    # set (and digest left empty) when the entry is a symbolic link
+    link: Optional[str] = None
+
+
+# run-scoped cache of hashed application trees, keyed by real path
+_trees: Dict[str, Dict[str, TreeEntry]] = dict()
+# the ignore rules of each tree, and the paths (mutation targets) kept whatever they say
+_rules: Dict[str, IgnoreRules] = dict()
+_kept: Dict[str, Set[str]] = dict()
+# store objects whose content this process checked, with the (inode, size, mtime) they had then
+_verified: Dict[str, Tuple[int, int, int]] = dict()
+
+
+def hash_file(path: str) -> str:
+    """Returns the hex sha256 of the contents of `path`"""
+    h = sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _entry(path: str) -> TreeEntry:
+    st = os.lstat(path)
+    if os.path.islink(path):
+        return TreeEntry('', st.st_mode & 0o777, 0, os.readlink(path))
+    if os.path.isdir(path):
+        return TreeEntry('', 0o755, 0)
+    return TreeEntry(hash_file(path), st.st_mode & 0o777, st.st_size)
+
+
+def _ignore_rules(root: str) -> IgnoreRules:
+    if root not in _rules:
+        _rules[root] = IgnoreRules.load(root)
+    return _rules[root]
+
+
+def _kept_dirs(root: str) -> Set[str]:
+    """The directories (ending in '/') holding a kept path, which are walked even if ignored"""
+    return { path[:i + 1] for path in _kept.get(root, ()) for i, c in enumerate(path) if c == '/' }
+
+
+def _included(root: str, rel_path: str, is_dir: bool) -> bool:
+    """Whether `rel_path` belongs in the tree of (real path) `root`"""
+    rel_path = rel_path.strip('/')
+    if rel_path in _kept.get(root, ()) or is_dir and rel_path + '/' in _kept_dirs(root):
+        return True
+    return not _ignore_rules(root).excluded(rel_path, is_dir)
+
+
+def pruned_dir(root: str, rel_dir: str) -> bool:
+    """ Whether the directory `rel_dir` of the tree at `root` is left out of it entirely:
+        its ignore rules exclude it, and it holds no kept path
+    """
+    return not _included(os.path.realpath(root), rel_dir, True)
+
+
+def _walk(root: str, tree: Dict[str, TreeEntry], start: str = '') -> None:
+    """ Adds the entries under ./`root`/`start` to `tree`, in walk order. Ignored
+        directories are pruned before anything in them is read, unless they hold
+        a kept path, in which case only the kept paths are taken from them.
+    """
+    rules, kept, kept_dirs = _ignore_rules(root), _kept.get(root, set()), _kept_dirs(root)
+    # the ignored directories walked for the kept paths under them
+    ignored_dirs = { start.strip('/') + '/' } if start and rules.excluded(start, True) else set()
+    for dir_path, dir_names, file_names in os.walk(os.path.join(root, start)):
+        rel_dir = os.path.relpath(dir_path, root)
+        prefix = '' if rel_dir == '.' else rel_dir + '/'
+        if not prefix:
+            dir_names[:] = [d for d in dir_names if not d.startswith('.')]
+            file_names = [f for f in file_names if not f.startswith('.')]
+        dir_names.sort()
+        inside_ignored = prefix in ignored_dirs
+
+        # symlinked directories are reproduced as links, never walked
+        linked_dirs = { d for d in dir_names if os.path.islink(os.path.join(dir_path, d)) }
+        dir_names[:] = [d for d in dir_names if d not in linked_dirs]
+        file_names = list(file_names) + sorted(linked_dirs)
+
+        walked = []
+        for name in dir_names:
+            rel_path = prefix + name + '/'
+            ignored = inside_ignored or rules.ignored(rel_path, True)
+            if ignored and rel_path not in kept_dirs:
+                continue
+            if ignored:
+                ignored_dirs.add(rel_path)
+            walked.append(name)
+            tree[rel_path] = TreeEntry('', 0o755, 0)
+        dir_names[:] = walked
+
+        for name in sorted(file_names):
+            rel_path = prefix + name
+            if rel_path in kept or not inside_ignored and not rules.ignored(rel_path, name in linked_dirs):
+                tree[rel_path] = _entry(os.path.join(dir_path, name))
+
+
+def retain_paths(root: str, rel_paths: Iterable[str]) -> Set[str]:
+    """ Keeps `rel_paths` (the files that mutations patch) in the tree of `root`
+        even where its ignore rules would leave them out. Returns the entries this
+        added to an already hashed tree.
+    """
+    key = os.path.realpath(root)
+    kept = _kept.get(key, set())
+    new = { os.path.normpath(p) for p in rel_paths } - kept
+    # replaced rather than updated, as a build on another thread may be walking the tree
+    _kept[key] = kept | new
+    return refresh_tree(root, new) if new and key in _trees else set()
+
+
+def hash_tree(root: str) -> Dict[str, TreeEntry]:
+    """ Hashes every file under `root`, returning a map from each relative path
+        (directories end in '/') to its TreeEntry.
+
+        Hidden entries directly under `root` are skipped, as the `cp -r root/*`
+        this replaces never copied them, and so is whatever the tree's ignore rules
+        (see ignore.py) leave out. Each tree is only hashed once per run.
+    """
+    key = os.path.realpath(root)
+    if key not in _trees:
+        tree: Dict[str, TreeEntry] = dict()
+        _walk(key, tree)
+        _trees[key] = tree
+    return _trees[key]
+
+
+def refresh_tree(root: str, rel_paths: Iterable[str]) -> Set[str]:
+    """ Rehashes only `rel_paths` (files or directories, relative to `root`)
+        in the cached tree of `root`. Returns the relative paths of the entries
+        that were added, changed or removed.
+    """
+    key = os.path.realpath(root)
+    if key not in _trees:
+        return set(hash_tree(root))
+
+    # updated in a copy, as a build on another thread may be reading the tree
+    tree = dict(_trees[key])
+    if IGNORE_FILE in map(os.path.normpath, rel_paths):
+        # the rules changed, so anything may have come in or gone out
+        forget_tree(root)
+        fresh_tree = hash_tree(root)
+        return { p for p in tree.keys() | fresh_tree.keys() if tree.get(p) != fresh_tree.get(p) }
+
+    changed = set()
+    for rel_path in rel_paths:
+        rel_path = rel_path.strip('/')
+        if not rel_path or rel_path.split('/')[0].startswith('.'):
+            continue
+        path = os.path.join(key, rel_path)
+        is_dir = os.path.isdir(path) and not os.path.islink(path)
+
+        # drop the old entry (and anything under it), then re-add what exists now
+        stale = { p: e for p, e in tree.items() if p in (rel_path, rel_path + '/') or p.startswith(rel_path + '/') }
+        for p in stale:
+            del tree[p]
+
+        fresh: Dict[str, TreeEntry] = dict()
+        if not _included(key, rel_path, is_dir):
+            pass
+        elif is_dir:
+            fresh[rel_path + '/'] = TreeEntry('', 0o755, 0)
+            _walk(key, fresh, rel_path)
+        elif os.path.lexists(path):
+            # a kept path may be the first entry taken from an ignored directory
+            parts = rel_path.split('/')
+            for i in range(1, len(parts)):
+                parent = '/'.join(parts[:i]) + '/'
+                if parent not in tree:
+                    fresh[parent] = TreeEntry('', 0o755, 0)
+            fresh[rel_path] = _entry(path)
+        tree.update(fresh)
+
+        changed.update(p for p in stale.keys() | fresh.keys() if stale.get(p) != fresh.get(p))
+    _trees[key] = tree
+    return changed
+
+
+def object_path(store: str, entry: TreeEntry) -> str:
+    """Returns where the content of `entry` lives in `store`"""
+    # executables get their own object, since hardlinks share a mode
+    suffix = '.x' if entry.mode & 0o111 else ''
+    return os.path.join(store, 'objects', entry.digest[:2], entry.digest[2:] + suffix)
+
+
+def _stamp(st: os.stat_result) -> Tuple[int, int, int]:
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def _intact(obj: str, entry: TreeEntry) -> bool:
+    """ Whether the stored `obj` still holds the content of `entry`. Objects keep the
+        modes of the application's files, so one may have been edited in place through
+        a question's link to it: it is hashed again the first time this process reuses
+        it, and whenever it changed since.
+    """
+    try:
+        st = os.stat(obj)
+    except OSError:
+        return False
+    if st.st_size != entry.size:
+        return False
+    if _verified.get(obj) != _stamp(st):
+        if hash_file(obj) != entry.digest:
+            return False
+        if st.st_mode & 0o777 != entry.mode and not st.st_mode & 0o222:
+            # stored read-only by an earlier version
+            os.chmod(obj, entry.mode)
+        _verified[obj] = _stamp(os.stat(obj))
+    return True
+
+
+def populate_store(root: str, store: str) -> Dict[str, TreeEntry]:
+    """ Hashes the tree at `root` and adds any content missing from `store`, or no
+        longer intact in it. Returns the hashed tree.
+    """
+    tree = hash_tree(root)
+    for rel_path, entry in tree.items():
+        if not entry.digest:
+            continue
+        obj = object_path(store, entry)
+        if _intact(obj, entry):
+            continue
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        # stage under a unique name so concurrent builds never see partial objects
+        tmp = f"{obj}.{os.getpid()}.tmp"
+        copyfile(os.path.join(root, rel_path), tmp)
+        os.chmod(tmp, entry.mode)
+        os.replace(tmp, obj)
+        _verified[obj] = _stamp(os.stat(obj))
+    return tree
+
+
+def prune_store(store: str) -> int:
+    """ Removes the objects of `store` that no question links any more and no tree hashed
+        by this process refers to, so that the store does not grow with every edit of
+        an application. Returns the number of objects removed.
+    """
+    referenced = { object_path(store, entry) for tree in _trees.values() for entry in tree.values() if entry.digest }
+    cutoff = time() - PRUNE_GRACE_SECONDS
+    removed = 0
+    for dir_path, _, file_names in os.walk(os.path.join(store, 'objects')):
+        for name in file_names:
+            obj = os.path.join(dir_path, name)
+            if name.endswith('.tmp') or obj in referenced:
+                continue
+            try:
+                # linking or unlinking a question's copy updates the object's ctime
+                st = os.lstat(obj)
+                if st.st_nlink == 1 and st.st_ctime < cutoff:
+                    os.unlink(obj)
+                    _verified.pop(obj, None)
+                    removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def reflink(src: str, dst: str) -> bool:
+    """Attempts a copy-on-write clone of `src` to `dst`, returning whether it worked"""
+    try:
+        from fcntl import ioctl
+    except ImportError:
+        return False
+
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        try:
+            ioctl(d.fileno(), FICLONE, s.fileno())
+            return True
+        except OSError:
+            pass
+    os.unlink(dst)
+    return False
+
+
+def link_or_copy(src: str, dst: str) -> None:
+    """ Makes `dst` a hardlink of `src`, falling back to a reflink and then a
+        plain copy when the two are not on the same filesystem
+    """
+    try:
+        os.link(src, dst)
+        return
+    except FileExistsError:
+        if os.path.samefile(src, dst):
+            return
+        os.unlink(dst)
+        return link_or_copy(src, dst)
+    except OSError:
+        pass
+
+    # a read-only copy left by an earlier build cannot be written over
+    if os.path.lexists(dst):
+        os.unlink(dst)
+    if not reflink(src, dst):
+        copyfile(src, dst)
+    copymode(src, dst)
+
+
+def _materialize_entry(dest: str, store: str, rel_path: str, entry: TreeEntry) -> bool:
+    """Materializes one entry under `dest`, returning whether it was a file"""
+    out_path = os.path.join(dest, rel_path)
+    if rel_path.endswith('/'):
+        os.makedirs(out_path, exist_ok=True)
+        return False
+    if entry.link is not None:
+        if os.path.lexists(out_path):
+            os.unlink(out_path)
+        os.symlink(entry.link, out_path)
+        return False
+    link_or_copy(object_path(store, entry), out_path)
+    return True
+
+
+def materialize_tree(root: str, dest: str, store: str) -> int:
+    """ Populates `dest` with the tree at `root` using links into the
+        content-addressed `store`. Returns the number of files materialized.
+    """
+    tree = populate_store(root, store)
+    os.makedirs(dest, exist_ok=True)
+    return sum(_materialize_entry(dest, store, p, e) for p, e in tree.items())
+
+
+def materialize_paths(root: str, dest: str, store: str, rel_paths: Iterable[str]) -> None:
+    """ Brings only `rel_paths` of an already materialized `dest` up to date with
+        the (refreshed) tree at `root`, removing those no longer in it
+    """
+    tree = populate_store(root, store)
+    # parents sort before their children
+    for rel_path in sorted(rel_paths):
+        out_path = os.path.join(dest, rel_path)
+        if rel_path in tree:
+            os.makedirs(os.path.dirname(out_path.rstrip('/')), exist_ok=True)
+            _materialize_entry(dest, store, rel_path, tree[rel_path])
+        elif os.path.isdir(out_path) and not os.path.islink(out_path.rstrip('/')):
+            rmtree(out_path)
+        elif os.path.lexists(out_path.rstrip('/')):
+            os.unlink(out_path.rstrip('/'))
+
+
+def forget_tree(root: str) -> None:
+    """Drops the cached hash of `root`, so the next use rehashes it from scratch"""
+    _trees.pop(os.path.realpath(root), None)
+    _rules.pop(os.path.realpath(root), None)
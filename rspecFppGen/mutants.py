@@ -0,0 +1,335 @@
+""" Synthesizes candidate mutations of the Ruby sources of an application, as entries
+    in the `mutations:` format of question YAMLs, for authors to pick strong ones from.
+
+    usage: python -m rspecFppGen.mutants <application root> [<path or glob> ...]
+                                         [-o mutants.yaml] [--operators relational,...] [-j N]
+"""
+from typing import *
+
+import os
+import sys
+from argparse import ArgumentParser
+from glob import glob, has_magic
+from json import dumps
+from re import compile, Match, Pattern
+from time import perf_counter
+
+from .consts import Bcolors
+
+# directories holding tests, dependencies or generated files: not searched for sources
+# unless a path names them
+SKIPPED_DIRS: Final[FrozenSet[str]] = frozenset({
+    'spec', 'test', 'features', 'vendor', 'node_modules', 'db', 'config', 'log', 'tmp', '.git'
+})
+
+# operators, longest first so that `<=` is never read as `<` followed by `=`;
+# arithmetic operators only count between spaces, to leave out unary minus and splats
+OPERATOR_PATTERN: Final[Pattern] = compile(
+    r'<=>|===|==|!=|=~|!~|<=|>=|<<|>>|=>|->|&&|\|\||\*\*=?|[-+*/%]=|(?<!:)[<>]|(?<![\w?!)\]])!(?=[\w@(])'
+    r'|(?<=\s)[-+*/%](?=\s)')
+KEYWORD_PATTERN: Final[Pattern] = compile(
+    r'(?<![\w.:@$])(and|or|not|true|false|if|unless|while|until)(?![\w?!:])')
+INTEGER_PATTERN: Final[Pattern] = compile(r'(?<![\w.@$:])\d+(?![\w.])')
+# `target = value` or `target ||= value`, where the value is not a block or a conditional,
+# and `return value`, each with any trailing `if`/`unless` modifier left out of the value
+VALUE: Final[str] = r'(?!(?:if|unless|case|begin|while|until|loop|lambda|proc)\b)(\S.*?)' \
+                    r'(?:\s+(?:if|unless|while|until)\s.*)?\s*$'
+ASSIGNMENT_PATTERN: Final[Pattern] = compile(
+    r'^(\s*)([@$]{0,2}[A-Za-z_][\w.\[\]:@]*\s*(?:\|\||[-+*/])?=\s*)(?![=~>])' + VALUE)
+RETURN_PATTERN: Final[Pattern] = compile(r'^(\s*return\s+)' + VALUE)
+HEREDOC_PATTERN: Final[Pattern] = compile(r'<<([~-]?)(["\'`]?)([A-Z_][A-Z0-9_]*)\2')
+# what starts a string, comment or heredoc in code, and what ends (or escapes) each string
+CODE_SPECIAL_PATTERN: Final[Pattern] = compile(r'["\'`#<]')
+STRING_END_PATTERNS: Final[Dict[str, Pattern]] = { q: compile(r'[\\' + q + ']') for q in '"\'`' }
+# characters a YAML block scalar cannot hold (or would take as a line break)
+UNPRINTABLE_PATTERN: Final[Pattern] = compile('[\x00-\x08\x0a-\x1f\x7f-\x9f\u2028\u2029\ufeff]')
+# a line ending in one of these continues on the next
+CONTINUED_PATTERN: Final[Pattern] = compile(r'(\bdo(\s*\|[^|]*\|)?|[{(\[,\\.]|[-+*/%&|<>=!?:])$')
+
+# replacements of each operator and keyword, by mutation operator
+RELATIONAL: Final[Dict[str, Tuple[str, ...]]] = {
+    '<': ('<=', '>='), '<=': ('<', '>'), '>': ('>=', '<='), '>=': ('>', '<'),
+    '==': ('!=',), '!=': ('==',),
+}
+ARITHMETIC: Final[Dict[str, Tuple[str, ...]]] = {
+    '+': ('-',), '-': ('+',), '*': ('/',), '/': ('*',), '%': ('*',), '**': ('*',),
+    '+=': ('-=',), '-=': ('+=',), '*=': ('/=',), '/=': ('*=',),
+}
+BOOLEAN: Final[Dict[str, Tuple[str, ...]]] = {
+    '&&': ('||',), '||': ('&&',), 'and': ('or',), 'or': ('and',), '!': ('',), 'not': ('',),
+    'true': ('false',), 'false': ('true',),
+    'if': ('unless',), 'unless': ('if',), 'while': ('until',), 'until': ('while',),
+}
+
+OPERATORS: Final[Tuple[str, ...]] = ('relational', 'arithmetic', 'boolean', 'constant', 'nil', 'drop')
+
+
+class Mutant(NamedTuple):
+    file: str
+    # 1-based line of `file` the mutant changes
+    line: int
+    operator: str
+    original: str
+    # the line that replaces the original, or None when the mutant deletes it
+    mutated: Optional[str]
+    description: str
+
+    def diff(self) -> str:
+        """The mutant as a normal diff, as question YAMLs list mutations"""
+        if self.mutated is None:
+            return f"{self.line}d{self.line - 1}\n< {self.original}\n"
+        return f"{self.line}c{self.line}\n< {self.original}\n---\n> {self.mutated}\n"
+
+
+def mask_code(lines: List[str]) -> List[Optional[str]]:
+    """ Blanks out the contents of string literals and comments in each of `lines`,
+        keeping every position, so that operators are only found in code. Lines of
+        heredocs, `=begin` comments and strings spanning lines come back as None.
+    """
+    masked: List[Optional[str]] = []
+    quote: Optional[str] = None
+    heredocs: List[Tuple[str, bool]] = []
+    in_comment = False
+    for line in lines:
+        if in_comment or line.startswith('=begin'):
+            in_comment = not line.startswith('=end')
+            masked.append(None)
+            continue
+        if heredocs:
+            terminator, indented = heredocs[0]
+            if (line.strip() if indented else line) == terminator:
+                heredocs.pop(0)
+            masked.append(None)
+            continue
+
+        continued = quote is not None
+        out = list(line)
+        i = 0
+        # jump from one character that matters to the next, most lines have few
+        while i < len(line):
+            if quote is not None:
+                end = STRING_END_PATTERNS[quote].search(line, i)
+                j = end.start() if end else len(line)
+                out[i:j] = ' ' * (j - i)
+                if end is None:
+                    break
+                if line[j] == '\\':
+                    out[j:j + 2] = ' ' * len(out[j:j + 2])
+                    i = j + 2
+                else:
+                    quote, i = None, j + 1
+                continue
+
+            special = CODE_SPECIAL_PATTERN.search(line, i)
+            if special is None:
+                break
+            i, c = special.start(), special[0]
+            if c == '#':
+                out[i:] = ' ' * (len(line) - i)
+                break
+            if c == '<':
+                heredoc = HEREDOC_PATTERN.match(line, i)
+                if heredoc:
+                    heredocs.append((heredoc[3], bool(heredoc[1])))
+                    i = heredoc.end()
+                    continue
+            else:
+                quote = c
+            i += 1
+        # a string left open (or closed) here spans lines, which no mutant touches
+        masked.append(None if continued or quote is not None else ''.join(out))
+    return masked
+
+
+def _complete(code: str) -> bool:
+    """Whether the statement on a (masked) line ends on it"""
+    code = code.strip()
+    if not code or CONTINUED_PATTERN.search(code):
+        return False
+    return all(code.count(a) == code.count(b) for a, b in ('()', '[]', '{}'))
+
+
+def line_mutants(file: str, n: int, line: str, code: str, operators: Collection[str]) -> Iterator[Mutant]:
+    """ Yields the mutants of line `n` of `file`, where `code` is the line as masked
+        by `mask_code`
+    """
+    def replace(operator: str, match: Match, group: int, replacement: str) -> Mutant:
+        start, end = match.span(group)
+        mutated = line[:start] + replacement + line[end:]
+        return Mutant(file, n, operator, line, mutated, f"{line[start:end]!r} to {replacement!r}")
+
+    stripped = code.strip()
+    # `class A < B` names a superclass, not a comparison
+    if stripped.startswith(('class ', 'module ', 'require', 'include ', 'extend ')):
+        return
+
+    for match in OPERATOR_PATTERN.finditer(code):
+        token = match[0]
+        for operator, table in (('relational', RELATIONAL), ('arithmetic', ARITHMETIC), ('boolean', BOOLEAN)):
+            if operator in operators and token in table:
+                for replacement in table[token]:
+                    yield replace(operator, match, 0, replacement)
+
+    if 'boolean' in operators:
+        for match in KEYWORD_PATTERN.finditer(code):
+            for replacement in BOOLEAN[match[1]]:
+                yield replace('boolean', match, 1, replacement)
+
+    if 'constant' in operators:
+        for match in INTEGER_PATTERN.finditer(code):
+            value = int(match[0])
+            for replacement in ([1] if value == 0 else [0, value + 1]):
+                yield replace('constant', match, 0, str(replacement))
+
+    if not _complete(code):
+        return
+    assignment = ASSIGNMENT_PATTERN.match(code)
+    returned = RETURN_PATTERN.match(code)
+    if 'nil' in operators:
+        for match in (assignment, returned):
+            if match and match.lastindex and match[match.lastindex] != 'nil':
+                yield replace('nil', match, match.lastindex, 'nil')
+    if 'drop' in operators and assignment and '||=' not in assignment[2]:
+        yield Mutant(file, n, 'drop', line, None, f"drops the assignment to {assignment[2].split('=')[0].strip()}")
+
+
+def file_mutants(root: str, file: str, operators: Collection[str] = OPERATORS) -> List[Mutant]:
+    """Every mutant of the source `file` (relative to `root`), in line order"""
+    try:
+        with open(os.path.join(root, file), 'r', newline='') as f:
+            lines = [line.rstrip('\r\n') for line in f.read().split('\n')]
+    except (OSError, UnicodeDecodeError):
+        return []
+
+    mutants = []
+    for n, (line, code) in enumerate(zip(lines, mask_code(lines)), 1):
+        if code is not None and not UNPRINTABLE_PATTERN.search(line):
+            mutants.extend(line_mutants(file, n, line, code, operators))
+    return mutants
+
+
+def source_files(root: str, paths: List[str] = None) -> List[str]:
+    """ The Ruby sources under `root` named by `paths` (files, directories or globs,
+        relative to `root`), or every source outside the SKIPPED_DIRS by default
+    """
+    def walk(top: str) -> Iterator[str]:
+        for dir_path, dir_names, file_names in os.walk(top):
+            dir_names[:] = sorted(d for d in dir_names if d not in SKIPPED_DIRS)
+            for name in sorted(file_names):
+                if name.endswith('.rb'):
+                    yield os.path.relpath(os.path.join(dir_path, name), root)
+
+    if not paths:
+        return list(walk(root))
+    files: Dict[str, None] = dict()
+    for path in paths:
+        full = os.path.join(root, path)
+        if os.path.isdir(full):
+            files.update(dict.fromkeys(walk(full)))
+        elif has_magic(full):
+            files.update(dict.fromkeys(os.path.relpath(p, root) for p in sorted(glob(full, recursive=True))
+                                       if p.endswith('.rb') and os.path.isfile(p)))
+        else:
+            files[os.path.relpath(full, root)] = None
+    return list(files)
+
+
+def synthesize(root: str, files: List[str], operators: Collection[str] = OPERATORS,
+               jobs: int = None) -> Tuple[List[Mutant], int]:
+    """ Generates the mutants of `files` on a pool of up to `jobs` processes (one
+        per core by default). Mutants that produce the same file as an earlier one
+        are dropped. Returns the mutants, in file and line order, and how many were dropped.
+    """
+    operators = tuple(operators)
+    jobs = jobs or os.cpu_count() or 1
+    if len(files) <= 1 or jobs == 1:
+        per_file = [file_mutants(root, file, operators) for file in files]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            per_file = list(pool.map(file_mutants, [root] * len(files), files, [operators] * len(files),
+                                     chunksize=max(1, len(files) // (4 * jobs))))
+
+    mutants: List[Mutant] = []
+    seen: Set[Tuple[str, int, Optional[str]]] = set()
+    for mutant in (m for file in per_file for m in file):
+        key = (mutant.file, mutant.line, mutant.mutated)
+        if mutant.mutated != mutant.original and key not in seen:
+            seen.add(key)
+            mutants.append(mutant)
+    return mutants, sum(map(len, per_file)) - len(mutants)
+
+
+SAFE_KEY_PATTERN: Final[Pattern] = compile(r'^[\w./][\w./-]*$')
+
+
+def mutants_yaml(mutants: List[Mutant], root: str) -> str:
+    """ Lays `mutants` out as a `mutations:` mapping to paste into question YAMLs,
+        each named after its operator, file and line and commented with what it does
+    """
+    lines = [f"# {len(mutants)} candidate mutants of {root}, generated by rspecFppGen.mutants", "mutations:"]
+    # how many mutants each name was given to, to number the later ones
+    names: Dict[str, int] = dict()
+    used: Set[str] = set()
+    slugs: Dict[str, Tuple[str, str]] = dict()
+    for mutant in mutants:
+        if mutant.file not in slugs:
+            slug = ''.join(c if c.isalnum() else '_' for c in os.path.splitext(mutant.file)[0]).strip('_')
+            key = mutant.file if SAFE_KEY_PATTERN.match(mutant.file) else dumps(mutant.file)
+            slugs[mutant.file] = slug, key
+        slug, key = slugs[mutant.file]
+        name = base = f"{mutant.operator}_{slug}_{mutant.line}"
+        while name in used:
+            names[base] = names.get(base, 1) + 1
+            name = f"{base}_{names[base]}"
+        used.add(name)
+
+        lines.append(f"  # {mutant.file}:{mutant.line} {mutant.operator}: {mutant.description}")
+        lines.append(f"  {name}:")
+        lines.append(f"    exclude: []")
+        lines.append(f"    files:")
+        lines.append(f"      {key}: |")
+        lines.extend(f"        {diff_line}" for diff_line in mutant.diff().splitlines())
+    return '\n'.join(lines) + '\n'
+
+
+def main(args: List[str] = None) -> None:
+    parser = ArgumentParser(prog="rspecFppGen.mutants",
+                            description="Generates candidate mutations of an application's Ruby sources")
+    parser.add_argument("root", metavar="application_root")
+    parser.add_argument("paths", nargs="*", metavar="path",
+                        help="sources, directories or (quoted) globs under the root to mutate "
+                             f"(default: every .rb file outside {', '.join(sorted(SKIPPED_DIRS))})")
+    parser.add_argument("-o", "--output", metavar="mutants.yaml", help="where to write the mutations (default: stdout)")
+    parser.add_argument("--operators", default=','.join(OPERATORS), metavar="LIST",
+                        help=f"comma-separated mutation operators to apply, of {', '.join(OPERATORS)}")
+    parser.add_argument("-j", "--jobs", type=int, default=None, metavar="N",
+                        help="scan files on up to N processes (default: one per core)")
+    parsed = parser.parse_args(args)
+
+    operators = [op.strip() for op in parsed.operators.split(',') if op.strip()]
+    unknown = set(operators) - set(OPERATORS)
+    if unknown:
+        parser.error(f"unknown operators {', '.join(sorted(unknown))}, expected some of {', '.join(OPERATORS)}")
+    if not os.path.isdir(parsed.root):
+        parser.error(f"{parsed.root} is not a directory")
+
+    start = perf_counter()
+    files = source_files(parsed.root, parsed.paths)
+    mutants, duplicates = synthesize(parsed.root, files, operators, parsed.jobs)
+    text = mutants_yaml(mutants, parsed.root)
+    if parsed.output:
+        with open(parsed.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text, end='')
+
+    # the report goes to stderr, so that stdout can be redirected to a YAML file
+    Bcolors.printf(Bcolors.OKGREEN, f"Generated {len(mutants)} mutants of {len(files)} files "
+                                    f"({duplicates} duplicates dropped) in {perf_counter() - start:.2f}s",
+                   file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
 from ast import *
 from typing import Union, Any, List, Tuple
 
-from dataclasses import dataclass
+from dataclasses import astuple, dataclass
+from hashlib import sha256
+from sys import version
 
-from consts import Bcolors, SERVER_DEFAULT
+from .cache import DiskCache
+from .consts import Bcolors, SERVER_DEFAULT, TOOL_VERSION
 
 @dataclass(init=True, repr=True, frozen=True)
 class AnnotatedName:
@@ -12,15 +15,36 @@ class AnnotatedName:
     description: str = None
 
 
+# names extracted by earlier runs, keyed by the code and the tool and interpreter that parsed it
+NAMES_CACHE = DiskCache('names')
+
+
 class GlobalNameVisitor(NodeVisitor):
     @staticmethod
     def get_names(code: str) -> List[AnnotatedName]:
+        """ Returns the global names `code` defines, parsing it only if no earlier run
+            has. Raises a SyntaxError if `code` cannot be parsed.
+        """
         if not code:
             return list()
 
+        # the grammar (and so the names found) depends on the interpreter
+        key = sha256(f"{TOOL_VERSION}\0{version}\0{code}".encode()).hexdigest()
+        cached = NAMES_CACHE.get(key)
+        if cached is not None:
+            if 'error' in cached:
+                raise SyntaxError(cached['error'])
+            return [AnnotatedName(*n) for n in cached['names']]
+
         visitor = GlobalNameVisitor()
-        visitor.visit(parse(code))
-        return [AnnotatedName(n, *t) if t else AnnotatedName(n) for n, t in visitor.names.items()]
+        try:
+            visitor.visit(parse(code))
+        except SyntaxError as e:
+            NAMES_CACHE.put(key, { 'error': str(e) })
+            raise
+        names = [AnnotatedName(n, *t) if t else AnnotatedName(n) for n, t in visitor.names.items()]
+        NAMES_CACHE.put(key, { 'names': [astuple(n) for n in names] })
+        return names
 
     def __init__(self) -> None:
         super().__init__()
@@ -0,0 +1,245 @@
+from typing import *
+
+import os
+from hashlib import sha256
+from shutil import copy2, copyfileobj, rmtree
+from tempfile import mkdtemp
+
+from .materialize import CHUNK_SIZE, hash_file, link_or_copy, object_path, populate_store
+
+# the parts of a question the generator owns outright: whatever of them it did not
+# write this time (a variant since removed from the YAML, say) is stale
+GENERATED_PREFIXES: Final[Tuple[str, ...]] = ('tests/common/', 'tests/var_')
+
+# renameat2(2) flag swapping two paths in one step, and the "relative to cwd" fd
+RENAME_EXCHANGE: Final[int] = 1 << 1
+AT_FDCWD: Final[int] = -100
+
+
+def same_content(path: str, data: bytes) -> bool:
+    """Whether the file at `path` already holds exactly `data`, compared by size and then hash"""
+    try:
+        if os.path.islink(path) or os.path.getsize(path) != len(data):
+            return False
+    except OSError:
+        return False
+    return hash_file(path) == sha256(data).hexdigest()
+
+
+def same_files(a: str, b: str) -> bool:
+    """Whether the files at `a` and `b` hold the same content, compared by size and then hash"""
+    try:
+        if os.path.samefile(a, b):
+            return True
+        if os.path.islink(b) or os.path.getsize(a) != os.path.getsize(b):
+            return False
+    except OSError:
+        return False
+    return hash_file(a) == hash_file(b)
+
+
+def exchange(a: str, b: str) -> bool:
+    """ Atomically swaps the paths `a` and `b` where the platform supports it,
+        returning whether it did
+    """
+    import ctypes
+    from ctypes.util import find_library
+
+    try:
+        renameat2 = ctypes.CDLL(find_library('c') or 'libc.so.6', use_errno=True).renameat2
+    except (OSError, AttributeError):
+        return False
+    return renameat2(AT_FDCWD, os.fsencode(a), AT_FDCWD, os.fsencode(b), RENAME_EXCHANGE) == 0
+
+
+def write_if_changed(path: str, content: Union[str, bytes]) -> bool:
+    """ Writes `content` to `path` unless it already holds it, replacing the file
+        atomically. Returns whether anything was written.
+    """
+    data = content.encode() if isinstance(content, str) else content
+    if same_content(path, data):
+        return False
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return True
+
+
+def default_dir_mode() -> int:
+    """The mode `mkdir` gives a new directory under the current umask"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o777 & ~umask
+
+
+def copy_if_changed(src: str, dst: str, text: bool = False) -> bool:
+    """ Streams `src` to `dst` unless they already match, replacing `dst`
+        atomically. Returns whether anything was written. With `text`, the
+        copy is made in text mode, so line endings are translated as `open`
+        translates them, and compared once translated.
+    """
+    if not text and same_files(src, dst):
+        return False
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    mode = '' if text else 'b'
+    with open(src, 'r' + mode) as s, open(tmp, 'w' + mode) as d:
+        copyfileobj(s, d, CHUNK_SIZE)
+    if text and same_files(tmp, dst):
+        os.unlink(tmp)
+        return False
+    os.replace(tmp, dst)
+    return True
+
+
+class QuestionWriter:
+    """ Every file of a question is written through one of these. Output is staged
+        in a hidden sibling of `root` and swapped into place by `commit`.
+
+        Files identical to those already in `root` are staged as hardlinks of the
+        existing ones, so they keep their inode and mtime, and if nothing at all
+        changed the staging directory is discarded without touching `root`. Files
+        in `root` the generator does not manage (assets an author added, say) are
+        carried over; only stale files under GENERATED_PREFIXES are dropped.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = os.path.normpath(root)
+        parent, name = os.path.split(self.root)
+        os.makedirs(parent or '.', exist_ok=True)
+        self.staging = mkdtemp(prefix=f".{name}.staging-", dir=parent or '.')
+        # whether each staged path differs from the one in `root`; a path staged
+        # twice (tests/ans.py is) is judged by its last version only
+        self.staged: Dict[str, bool] = dict()
+        self.bytes_written = 0
+
+    @property
+    def changed(self) -> bool:
+        return any(self.staged.values())
+
+    def path(self, rel_path: str) -> str:
+        """Where `rel_path` is staged (for reading back what was just written)"""
+        return os.path.join(self.staging, rel_path)
+
+    def read(self, rel_path: str) -> str:
+        """Reads back the text staged as `rel_path`, line endings untouched"""
+        with open(self.path(rel_path), 'r', newline='') as f:
+            return f.read()
+
+    def _stage(self, rel_path: str) -> Tuple[str, str]:
+        staged = self.path(rel_path)
+        os.makedirs(os.path.dirname(staged), exist_ok=True)
+        if os.path.lexists(staged):
+            os.unlink(staged)
+        return staged, os.path.join(self.root, rel_path)
+
+    def _keep(self, final: str, staged: str) -> None:
+        try:
+            os.link(final, staged)
+        except OSError:
+            copy2(final, staged)
+
+    def write(self, rel_path: str, content: Union[str, bytes]) -> int:
+        """Stages `content` as `rel_path`, returning its size in bytes"""
+        data = content.encode() if isinstance(content, str) else content
+        staged, final = self._stage(rel_path)
+        if same_content(final, data):
+            self._keep(final, staged)
+            # dicts are safe to update from the variant threads
+            self.staged[rel_path] = False
+        else:
+            with open(staged, 'wb') as f:
+                f.write(data)
+            self.staged[rel_path] = True
+            self.bytes_written += len(data)
+        return len(data)
+
+    def link(self, rel_path: str, src: str) -> None:
+        """Stages `src` as `rel_path`, by hardlink where possible"""
+        staged, final = self._stage(rel_path)
+        if same_files(src, final) and os.stat(src).st_mode == os.stat(final).st_mode:
+            self._keep(final, staged)
+            self.staged[rel_path] = False
+        else:
+            link_or_copy(src, staged)
+            self.staged[rel_path] = True
+
+    def symlink(self, rel_path: str, target: str) -> None:
+        staged, final = self._stage(rel_path)
+        os.symlink(target, staged)
+        self.staged[rel_path] = not os.path.islink(final) or os.readlink(final) != target
+
+    def mkdir(self, rel_path: str) -> None:
+        os.makedirs(self.path(rel_path), exist_ok=True)
+
+    def materialize(self, rel_dir: str, root: str, store: str) -> int:
+        """ Stages the application tree at `root` under `rel_dir` using links into
+            the content-addressed `store`. Returns the number of files staged.
+        """
+        files = 0
+        for rel_path, entry in populate_store(root, store).items():
+            out_path = os.path.join(rel_dir, rel_path)
+            if rel_path.endswith('/'):
+                self.mkdir(out_path)
+            elif entry.link is not None:
+                self.symlink(out_path, entry.link)
+            else:
+                self.link(out_path, object_path(store, entry))
+                files += 1
+        return files
+
+    def _existing(self) -> Set[str]:
+        """The files (and symlinks) already in `root`, relative to it"""
+        existing = set()
+        for dir_path, dir_names, file_names in os.walk(self.root):
+            rel_dir = os.path.relpath(dir_path, self.root)
+            # symlinked directories are listed, never walked
+            links = [d for d in dir_names if os.path.islink(os.path.join(dir_path, d))]
+            for name in file_names + links:
+                existing.add(os.path.normpath(os.path.join(rel_dir, name)))
+        return existing
+
+    def _carry_over(self, rel_path: str) -> None:
+        """Stages the file already at `rel_path` in `root` as it is"""
+        staged, final = self._stage(rel_path)
+        if os.path.islink(final):
+            os.symlink(os.readlink(final), staged)
+        else:
+            self._keep(final, staged)
+
+    def commit(self) -> bool:
+        """ Swaps the staged question into place, unless it is identical to what is
+            already there. Returns whether `root` changed.
+        """
+        staged = set(map(os.path.normpath, self.staged))
+        unwritten = self._existing() - staged
+        stale = { p for p in unwritten if p.replace(os.sep, '/').startswith(GENERATED_PREFIXES) }
+        if not self.changed and os.path.isdir(self.root) and not stale:
+            rmtree(self.staging)
+            return False
+
+        for rel_path in unwritten - stale:
+            self._carry_over(rel_path)
+
+        # mkdtemp made the staging directory private, but it becomes the question
+        try:
+            mode = os.stat(self.root).st_mode & 0o7777
+        except OSError:
+            mode = default_dir_mode()
+        os.chmod(self.staging, mode)
+
+        if os.path.lexists(self.root) and exchange(self.staging, self.root):
+            # the staging directory now holds the previous build
+            rmtree(self.staging)
+        elif os.path.lexists(self.root):
+            trash = mkdtemp(prefix=f".{os.path.basename(self.root)}.old-", dir=os.path.dirname(self.staging))
+            os.rename(self.root, os.path.join(trash, 'question'))
+            os.rename(self.staging, self.root)
+            rmtree(trash)
+        else:
+            os.rename(self.staging, self.root)
+        return True
+
+    def abort(self) -> None:
+        """Discards everything staged, leaving `root` as it was"""
+        rmtree(self.staging, ignore_errors=True)
@@ -0,0 +1,195 @@
+from typing import *
+
+from dataclasses import dataclass, field
+from re import compile, Pattern
+
+# `4c4`, `3,5d2`, `7a8,9`
+NORMAL_HUNK_PATTERN: Final[Pattern] = compile(r'^(\d+)(?:,(\d+))?([acd])(\d+)(?:,(\d+))?\s*$')
+# `@@ -4,7 +4,7 @@ optional section heading`
+UNIFIED_HUNK_PATTERN: Final[Pattern] = compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+NO_NEWLINE_MARKER: Final[str] = '\\ No newline at end of file'
+
+
+class PatchError(RuntimeError):
+    """Raised when a diff is malformed or one of its hunks does not apply"""
+
+    def __init__(self, message: str, line: int = None) -> None:
+        super().__init__(message)
+        # 1-based line of the diff text at fault, when known
+        self.line = line
+
+
+@dataclass
+class Hunk:
+    # 0-based index of the first original line the hunk replaces
+    old_start: int
+    # lines expected in the original (context and removals), without line endings
+    old_lines: List[str] = field(default_factory=list)
+    # lines that take their place, without line endings
+    new_lines: List[str] = field(default_factory=list)
+    # 1-based line of the hunk header within the diff text
+    line: int = 0
+    header: str = ''
+    # the last new line is the end of the file, with no trailing newline
+    no_newline: bool = False
+
+
+def parse_diff(diff: str) -> List[Hunk]:
+    """ Parses `diff`, which may be a normal diff (`4c4` / `<` / `---` / `>`)
+        or a unified diff (`@@ -4 +4 @@` / `-` / `+`), into its hunks
+    """
+    lines = diff.splitlines()
+    if any(UNIFIED_HUNK_PATTERN.match(l) for l in lines):
+        return _parse_unified(lines)
+    return _parse_normal(lines)
+
+
+def _parse_normal(lines: List[str]) -> List[Hunk]:
+    hunks: List[Hunk] = []
+    # number of original lines each hunk's header claims
+    claimed: List[int] = []
+    hunk: Hunk = None
+    for n, text in enumerate(lines, 1):
+        header = NORMAL_HUNK_PATTERN.match(text)
+        if header:
+            start, end, command = int(header[1]), header[2], header[3]
+            # `a` inserts after line `start`, `c` and `d` begin at it
+            hunk = Hunk(start if command == 'a' else start - 1, line=n, header=text.strip())
+            hunks.append(hunk)
+            claimed.append(0 if command == 'a' else (int(end) if end else start) - start + 1)
+        elif hunk is None:
+            if text.strip():
+                raise PatchError(f"line {n} of the diff is not a hunk header: {text!r}", n)
+        elif text.startswith('< ') or text == '<':
+            hunk.old_lines.append(text[2:])
+        elif text.startswith('> ') or text == '>':
+            hunk.new_lines.append(text[2:])
+        elif text == '---':
+            continue
+        elif text.startswith(NO_NEWLINE_MARKER):
+            hunk.no_newline = bool(hunk.new_lines)
+        elif text.strip():
+            raise PatchError(f"line {n} of the diff is malformed in hunk {hunk.header!r}: {text!r}", n)
+
+    for hunk, count in zip(hunks, claimed):
+        if len(hunk.old_lines) != count:
+            raise PatchError(
+                f"hunk {hunk.header!r} (diff line {hunk.line}) claims {count} "
+                f"original line(s) but lists {len(hunk.old_lines)}", hunk.line)
+    return hunks
+
+
+def _parse_unified(lines: List[str]) -> List[Hunk]:
+    hunks: List[Hunk] = []
+    hunk: Hunk = None
+    for n, text in enumerate(lines, 1):
+        header = UNIFIED_HUNK_PATTERN.match(text)
+        if header:
+            start = int(header[1])
+            old_count = int(header[2]) if header[2] is not None else 1
+            # an empty old range names the line *after which* to insert
+            hunk = Hunk(start if old_count == 0 else start - 1, line=n, header=text.strip())
+            hunks.append(hunk)
+        elif hunk is None:
+            # file headers (and anything before the first hunk) carry no edits
+            continue
+        elif text.startswith(' ') or text == '':
+            hunk.old_lines.append(text[1:])
+            hunk.new_lines.append(text[1:])
+        elif text.startswith('-'):
+            hunk.old_lines.append(text[1:])
+        elif text.startswith('+'):
+            hunk.new_lines.append(text[1:])
+        elif text.startswith(NO_NEWLINE_MARKER):
+            # the marker is about the line before it: after a removal, the original's end
+            hunk.no_newline = not lines[n - 2].startswith('-')
+        else:
+            raise PatchError(f"line {n} of the diff is malformed in hunk {hunk.header!r}: {text!r}", n)
+    return hunks
+
+
+def _matches(lines: List[str], at: int, expected: List[str]) -> bool:
+    if at < 0 or at + len(expected) > len(lines):
+        return False
+    return all(lines[at + i].rstrip('\r\n') == e.rstrip('\r') for i, e in enumerate(expected))
+
+
+def _locate(lines: List[str], hunk: Hunk, floor: int) -> Optional[int]:
+    """ Finds where `hunk` applies, trying its stated position first and then
+        the nearest offsets (as `patch` does), never before `floor`
+    """
+    if not hunk.old_lines:
+        return hunk.old_start if floor <= hunk.old_start <= len(lines) else None
+
+    for offset in range(len(lines) + 1):
+        for at in (hunk.old_start + offset, hunk.old_start - offset):
+            if at >= floor and _matches(lines, at, hunk.old_lines):
+                return at
+    return None
+
+
+def apply_hunks(lines: List[str], hunks: List[Hunk], errors: List[PatchError] = None) -> List[str]:
+    """ Applies `hunks` (in order) to `lines`, which keep their line endings.
+        Returns the patched lines or raises a PatchError naming the failing hunk.
+        Given an `errors` list, failing hunks are instead appended to it and skipped,
+        so that every failure in the diff can be reported at once.
+    """
+    out: List[str] = []
+    cursor = 0
+    for i, hunk in enumerate(hunks, 1):
+        at = _locate(lines, hunk, cursor)
+        if at is None:
+            expected = hunk.old_lines[0] if hunk.old_lines else ''
+            error = PatchError(
+                f"hunk #{i} {hunk.header!r} (diff line {hunk.line}) does not apply: "
+                f"expected {expected!r} near line {hunk.old_start + 1}", hunk.line)
+            if errors is None:
+                raise error
+            errors.append(error)
+            continue
+
+        out.extend(lines[cursor:at])
+        if hunk.new_lines and out and not out[-1].endswith('\n'):
+            # appending past an original that lacked its final newline
+            out[-1] += '\n'
+        replaced = lines[at:at + len(hunk.old_lines)]
+        for j, text in enumerate(hunk.new_lines):
+            # reuse the ending of the line being replaced, so CRLF files stay CRLF
+            ending = '\n'
+            if j < len(replaced) and replaced[j].endswith('\r\n'):
+                ending = '\r\n'
+            out.append(text + ending)
+        if hunk.no_newline and out:
+            out[-1] = out[-1].rstrip('\r\n')
+        cursor = at + len(hunk.old_lines)
+
+    out.extend(lines[cursor:])
+    return out
+
+
+def split_lines(text: str) -> List[str]:
+    """Splits `text` after each '\\n', keeping the line endings"""
+    lines = [line + '\n' for line in text.split('\n')]
+    last = lines.pop()
+    if last != '\n':
+        lines.append(last[:-1])
+    return lines
+
+
+def apply_diff(original: str, diff: str) -> str:
+    """Returns `original` with the normal or unified `diff` applied"""
+    return ''.join(apply_hunks(split_lines(original), parse_diff(diff)))
+
+
+def check_diff(lines: List[str], diff: str) -> List[PatchError]:
+    """ Returns every error in applying `diff` to `lines` (as from `split_lines`),
+        without stopping at the first
+    """
+    try:
+        hunks = parse_diff(diff)
+    except PatchError as e:
+        return [e]
+    errors: List[PatchError] = []
+    apply_hunks(lines, hunks, errors)
+    return errors
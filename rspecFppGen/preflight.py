@@ -0,0 +1,180 @@
+from typing import *
+
+import os
+from functools import lru_cache
+from hashlib import sha256
+
+from .cache import DiskCache
+from .course import QuestionSpec, parse_yaml
+from .fingerprint import tool_fingerprint
+from .materialize import hash_tree
+from .patching import check_diff, split_lines
+
+# yaml is only imported to check a question not found sound before
+if TYPE_CHECKING:
+    from yaml.nodes import Node
+
+# questions found to have no broken mutation, keyed by `_checked_key`
+CHECKED_CACHE: Final[DiskCache] = DiskCache('preflight')
+
+
+class MutationFailure(NamedTuple):
+    yaml_path: str
+    # 1-based line of the YAML the failure points at (0 when there is none)
+    line: int
+    message: str
+    variant: str = ''
+    file: str = ''
+    # the question YAML itself is unreadable or malformed, rather than a diff broken
+    malformed: bool = False
+
+    def __str__(self) -> str:
+        where = f"{self.variant}: {self.file}: " if self.file else f"{self.variant}: " if self.variant else ''
+        return f"{self.yaml_path}:{self.line}: {where}{self.message}"
+
+
+def _entries(node: 'Node') -> Dict[str, Tuple['Node', 'Node']]:
+    """The (key, value) nodes of a mapping node by key, empty for any other node"""
+    from yaml.nodes import MappingNode, ScalarNode
+
+    if not isinstance(node, MappingNode):
+        return dict()
+    return { k.value: (k, v) for k, v in node.value if isinstance(k, ScalarNode) }
+
+
+def _yaml_line(node: 'Node', diff_line: Optional[int]) -> int:
+    """Maps line `diff_line` of the diff held by `node` to a 1-based line of the YAML"""
+    from yaml.nodes import ScalarNode
+
+    if diff_line is not None and isinstance(node, ScalarNode) and node.style == '|':
+        # a literal block keeps its lines, starting after the `|` indicator
+        return node.start_mark.line + 1 + diff_line
+    return node.start_mark.line + 1
+
+
+def _read_lines(path: str) -> List[str]:
+    with open(path, 'r', newline='') as f:
+        return split_lines(f.read())
+
+
+@lru_cache(maxsize=1024)
+def _digest_lines(path: str, digest: str) -> List[str]:
+    """`_read_lines`, cached by content digest too so an edited file is read afresh"""
+    return _read_lines(path)
+
+
+def common_lines(common: str, filename: str) -> List[str]:
+    """ The lines of a common file, read and split once per version of its content
+        (as hashed by `hash_tree`) however many variants patch it
+    """
+    path = os.path.join(common, filename)
+    entry = hash_tree(common).get(os.path.normpath(filename))
+    if entry is None or not entry.digest:
+        return _read_lines(path)
+    return _digest_lines(os.path.realpath(path), entry.digest)
+
+
+def _checked_key(data: bytes, common: str) -> Optional[str]:
+    """ Hashes the question text `data` with the common files its mutations patch
+        (and the tool), or returns None if they cannot all be found
+    """
+    try:
+        variants = parse_yaml(data).get('mutations') or {}
+        files = sorted({ os.path.normpath(file) for details in variants.values() for file in details['files'] })
+        tree = hash_tree(common)
+        h = sha256(tool_fingerprint().encode())
+        h.update(data)
+        for file in files:
+            h.update(f"\0{file}\0{tree[file].digest}".encode())
+    except (ValueError, AttributeError, KeyError, TypeError):
+        return None
+    return h.hexdigest()
+
+
+def already_checked(yaml_path: str, common: str) -> bool:
+    """Whether an earlier check found the question sound, with the same text and common files"""
+    try:
+        with open(yaml_path, 'rb') as f:
+            key = _checked_key(f.read(), common)
+    except OSError:
+        return False
+    return key is not None and CHECKED_CACHE.get(key) is not None
+
+
+def check_question(yaml_path: str, common: str) -> List[MutationFailure]:
+    """ Applies every mutation of the question at `yaml_path` in memory to the
+        files under `common`, returning every failure found
+    """
+    import yaml
+    from yaml.nodes import MappingNode, ScalarNode
+
+    # libyaml's composer keeps marks too, and is an order of magnitude faster
+    Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    try:
+        with open(yaml_path, 'rb') as f:
+            data = f.read()
+        key = _checked_key(data, common)
+        loader = Loader(data)
+        try:
+            # composing (rather than loading) keeps each value's position in the file
+            root = loader.get_single_node()
+        finally:
+            loader.dispose()
+    except OSError as e:
+        return [MutationFailure(yaml_path, 0, str(e), malformed=True)]
+    except yaml.MarkedYAMLError as e:
+        mark = e.problem_mark or e.context_mark
+        return [MutationFailure(yaml_path, mark.line + 1 if mark else 0, f"invalid YAML: {e.problem or e}",
+                                malformed=True)]
+
+    failures = []
+    _, variants = _entries(root).get('mutations', (None, None))
+    for variant, (variant_key, details) in _entries(variants).items():
+        files_key, files = _entries(details).get('files', (None, None))
+        if not isinstance(files, MappingNode):
+            failures.append(MutationFailure(
+                yaml_path, (files_key or variant_key).start_mark.line + 1,
+                "expected a `files:` mapping of common files to diffs", variant, malformed=True))
+            continue
+
+        for file, (file_key, diff) in _entries(files).items():
+            fail = lambda line, message, malformed=False: failures.append(
+                MutationFailure(yaml_path, line, message, variant, file, malformed))
+            if not isinstance(diff, ScalarNode):
+                fail(diff.start_mark.line + 1, "expected the diff as a string", True)
+                continue
+            try:
+                lines = common_lines(common, file)
+            except OSError as e:
+                fail(file_key.start_mark.line + 1, f"cannot read the common file: {e.strerror}")
+                continue
+            for error in check_diff(lines, diff.value):
+                fail(_yaml_line(diff, error.line), str(error))
+
+    if not failures and key is not None:
+        CHECKED_CACHE.put(key, True)
+    return failures
+
+
+def _check_in_worker(yaml_path: str, common: str, cache: bool) -> List[MutationFailure]:
+    """`check_question` on a pool process, using the cache only if the caller does"""
+    with DiskCache.using(cache):
+        return check_question(yaml_path, common)
+
+
+def preflight(specs: List[QuestionSpec], jobs: int = None) -> List[MutationFailure]:
+    """ Checks every mutation of every question on a pool of up to `jobs` processes
+        (one per core by default), returning all the failures in the order given.
+        Questions already found sound are skipped.
+    """
+    specs = [s for s in specs if not already_checked(s.yaml_path, s.app_root)]
+    yaml_paths, app_roots = [s.yaml_path for s in specs], [s.app_root for s in specs]
+    if len(specs) <= 1 or jobs == 1:
+        results = list(map(check_question, yaml_paths, app_roots))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            caching = [DiskCache.active()] * len(specs)
+            results = list(pool.map(_check_in_worker, yaml_paths, app_roots, caching))
+    return [failure for failures in results for failure in failures]
@@ -1,13 +1,55 @@
-from subprocess import run, PIPE
-from typing import Any, Dict
-import yaml
-from json import dumps as json_dumps
-from sys import argv
+from typing import TYPE_CHECKING, Any, Callable, Dict, Final, List, NamedTuple, Set, Tuple, Union
+from argparse import ArgumentParser, Namespace
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+from json import dumps as json_dumps, loads as json_loads
 import os
-from uuid import uuid4
 
-base_info_json = lambda: f"""{{
-    "uuid": "{uuid4()}",
+from .cache import DiskCache
+from .consts import Bcolors
+from .course import CourseError, QuestionSpec, expand_yaml_paths, load_course, load_yaml, parse_yaml
+from .fingerprint import BuildManifest, question_fingerprint, tree_fingerprint
+from .grading import GradingCost, timeout_override
+from .materialize import STORE_DIR, forget_tree, hash_tree, materialize_paths, \
+    populate_store, prune_store, refresh_tree, retain_paths
+from .output import QuestionWriter, write_if_changed
+from .timing import TRACER
+
+# the fpp generator, the patcher and the archive formats are imported where they
+# are used (and yaml only to parse a question not in the cache), so that a run with
+# nothing to rebuild starts quickly
+if TYPE_CHECKING:
+    from .archive import Archive, ArchiveWriter
+
+Writer = Union[QuestionWriter, 'ArchiveWriter']
+
+class BuildError(RuntimeError):
+    """A question that cannot be built as written; nothing of its build is kept"""
+
+class QuestionError(BuildError):
+    """A question YAML that is invalid, or lacks a required field"""
+
+class MutationError(BuildError):
+    """A mutation that does not apply to the common file it patches"""
+
+class Progress:
+    """ Where a build reports each of its steps. This one prints them, for the command
+        line; the API collects them into each question's result instead (see api.py).
+    """
+
+    def info(self, message: str) -> None:
+        print(message)
+
+    def warn(self, message: str) -> None:
+        Bcolors.warn(message)
+
+PRINT_PROGRESS: Final[Progress] = Progress()
+
+def base_info_json(uuid: str = None, timeout: int = 60) -> str:
+    from uuid import uuid4
+
+    return f"""{{
+    "uuid": "{uuid or uuid4()}",
     "title": "",
     "topic": "",
     "tags": [],
@@ -18,125 +60,320 @@ base_info_json = lambda: f"""{{
         "enabled": true,
         "image" : "nalsoon/rspec-autograder",
         "entrypoint": "/grader/run.py",
-        "timeout" : 60
+        "timeout" : {timeout}
     }}
 }}
 """
 
-def safe_mkdir(path: str) -> None:
-    if not os.path.exists(path):
-        os.mkdir(path)
-
-def write_to(filename: str, content: str) -> None:
-    with open(filename, 'w') as file:
-        file.write(content)
+def existing_uuid(q_root: str) -> str:
+    """Returns the uuid of the question already at `q_root`, if there is one"""
+    try:
+        with open(f"{q_root}/info.json", 'r') as f:
+            return json_loads(f.read()).get("uuid")
+    except (OSError, ValueError):
+        return None
 
-def make_parson_source(generation_dir: str, prompt: str, solution: Dict[str, str], q_name: str) -> None:
+def make_parson_source(prompt: str, solution: Dict[str, str]) -> str:
     """Make source.py for the Faded-Parson's problem system"""
-    source = f"""\"\"\"{prompt}\"\"\"
+    return f"""\"\"\"{prompt}\"\"\"
 \n
 {json_dumps(solution)}
 \n
 """
-    write_to(f"{generation_dir}/{q_name}.py", source)
     
-def apply_mutation(q_root: str, mutations: str, filename: str, variant_name: str) -> int:
-    """runs `patch` on the filename with patchfile input `mutations` and returns stderr as bytes"""
-    in_file = f"{q_root}/tests/common/{filename}"
-    out_file = f"{q_root}/tests/var_{variant_name}/{filename}"
+def apply_mutation(mutations: str, original: str) -> str:
+    """ Applies the diff `mutations` to `original`, the text of a common file.
+        Raises a PatchError if a hunk fails.
+    """
+    from .patching import apply_diff
 
-    command = [
-        "patch",
-        "-o", out_file,
-        in_file,
-    ]
+    return apply_diff(original, mutations)
 
-    return_code = run(command, input=mutations.encode(), stderr=PIPE).returncode
-    return return_code
+def patch_variants(read_common: Callable[[str], str], variants: Dict, jobs: int = None) -> Dict[str, Dict[str, str]]:
+    """ Patches the files of every variant on a pool of up to `jobs` threads, returning
+        each variant's patched files by name. Patching itself holds the GIL, so the pool
+        mostly overlaps the reads of the common files. The first failure cancels the
+        variants that have not started yet and is raised as a MutationError.
+    """
+    from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+    from contextvars import copy_context
+    from .patching import PatchError
 
-def generate_variants(q_root: str, variants: Dict):
+    def patch_variant(variant: str, files: Dict[str, str]) -> Dict[str, str]:
+        patched = dict()
+        with TRACER.span("variant", variant=variant, files=len(files)) as variant_span:
+            variant_span["bytes"] = 0
+            for file, mutations in files.items():
+                with TRACER.span("patch", variant=variant, file=file, files=1) as patch_span:
+                    try:
+                        patched[file] = apply_mutation(mutations, read_common(file))
+                    except (PatchError, OSError) as e:
+                        raise MutationError(f"Unexpected error when applying mutation to {file} in variant {variant}: {e}")
+                    patch_span["bytes"] = len(patched[file].encode())
+                variant_span["bytes"] += patch_span["bytes"]
+        return patched
 
-    # each suite has a set of mutations
-    # for variant, files in variants.items():
-    for variant, data in variants.items():
-        safe_mkdir(f"{q_root}/tests/var_{variant}")
-        files = data["files"]
+    # each suite has a set of mutations, patched in the caller's context so that it gets their spans
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {
+            variant: pool.submit(copy_context().run, patch_variant, variant, data["files"])
+            for variant, data in variants.items()
+        }
+        _, pending = wait(futures.values(), return_when=FIRST_EXCEPTION)
+        for future in pending:
+            future.cancel()
+
+    # report the first failure in the order the variants were listed
+    for future in futures.values():
+        if not future.cancelled() and future.exception():
+            raise future.exception()
+    return { variant: future.result() for variant, future in futures.items() }
+
+def variant_fingerprint(patched: Dict[str, str], read_common: Callable[[str], str]) -> str:
+    """ Hashes the files a variant actually changes, so that variants with the same
+        effect hash the same whatever no-op edits they list. A variant that changes
+        nothing hashes as the empty string.
+    """
+    from hashlib import sha256
+
+    changed = sorted((os.path.normpath(file), text) for file, text in patched.items() if text != read_common(file))
+    if not changed:
+        return ''
+    h = sha256()
+    for file, text in changed:
+        h.update(f"{file}\0{sha256(text.encode()).hexdigest()}\n".encode())
+    return h.hexdigest()
+
+def collapse_variants(patched: Dict[str, Dict[str, str]], read_common: Callable[[str], str],
+                      variants: Dict, progress: Progress = PRINT_PROGRESS) -> Dict[str, List[str]]:
+    """ Drops the variants that leave every file as it was and merges the variants
+        that produce the same files into the first of them, whose grading exclusions
+        become the union of theirs. Each variant costs a grader run per submission,
+        so the ones a student cannot tell apart are not worth keeping.
+        Returns the grading exclusions of each variant kept, in the order listed.
+    """
+    exclusions: Dict[str, List[str]] = dict()
+    kept: Dict[str, str] = dict()
+    for variant, files in patched.items():
+        exclude = variants[variant].get("exclude") or []
+        fingerprint = variant_fingerprint(files, read_common)
+        if not fingerprint:
+            progress.warn(f"  Dropping variant {variant}: its mutations leave every file as it was")
+        elif fingerprint in kept:
+            first = kept[fingerprint]
+            progress.warn(f"  Merging variant {variant} into {first}: they produce the same files")
+            exclusions[first].extend(test for test in exclude if test not in exclusions[first])
+        else:
+            kept[fingerprint] = variant
+            exclusions[variant] = list(exclude)
+    return exclusions
+
+class VariantOutput(NamedTuple):
+    # tests the variant leaves out of grading
+    exclude: List[str]
+    # sha256 of each file the variant writes over the common tree, by path
+    digests: Dict[str, str]
+
+def generate_variants(writer: Writer, variants: Dict, jobs: int = None,
+                      progress: Progress = PRINT_PROGRESS) -> Dict[str, VariantOutput]:
+    """ Patches every variant (see `patch_variants`), collapses the duplicate and no-op
+        ones (see `collapse_variants`) and writes the rest, which are returned. The
+        variants kept are written concurrently on a pool of up to `jobs` threads, where
+        the file I/O and hashing (which release the GIL) overlap.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from contextvars import copy_context
+    from functools import lru_cache
+    from hashlib import sha256
 
-        for file, mutations in files.items():
-            os.makedirs(os.path.dirname(f"{q_root}/tests/var_{variant}/{file}"), exist_ok=True)
-            err: int = apply_mutation(q_root, mutations, file, variant)
-            if err: # make sure to swap file and mutations args
-                raise RuntimeError(f"Unexpected error when applying mutation to {file} in variant {variant}: Exited with code {err}")
+    # variants commonly mutate the same few files, so only read each once
+    @lru_cache(maxsize=None)
+    def read_common(filename: str) -> str:
+        return writer.read(f"tests/common/{filename}")
 
-def write_solution(q_root: str, solution: str) -> None:
+    def write_variant(variant: str, exclude: List[str]) -> VariantOutput:
+        files = { os.path.normpath(file): text.encode() for file, text in patched[variant].items() }
+        with TRACER.span("variant output", variant=variant, files=len(files)) as span:
+            writer.mkdir(f"tests/var_{variant}")
+            span["bytes"] = sum(writer.write(f"tests/var_{variant}/{file}", data) for file, data in files.items())
+        return VariantOutput(exclude, { file: sha256(data).hexdigest() for file, data in files.items() })
+
+    patched = patch_variants(read_common, variants, jobs)
+    kept = collapse_variants(patched, read_common, variants, progress)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = { variant: pool.submit(copy_context().run, write_variant, variant, exclude)
+                    for variant, exclude in kept.items() }
+    # results (and the first failure) in the order the variants were listed
+    return { variant: future.result() for variant, future in futures.items() }
+
+def write_solution(writer: Writer, solution: str) -> int:
     """Generate tests/solution/_submission_file using the provided solution"""
-    write_to(f"{q_root}/tests/solution/_submission_file", solution.replace('?', ''))
-    write_to(f"{q_root}/tests/ans.py", solution.replace('?', ''))
+    return writer.write("tests/solution/_submission_file", solution.replace('?', '')) \
+        + writer.write("tests/ans.py", solution.replace('?', ''))
+
+def common_manifest(common: str) -> Dict[str, Any]:
+    """The files of the tree at `common` by path and sha256, and its symlinks' targets"""
+    # sorted, so that a tree refreshed in watch mode is listed as a fresh process lists it
+    tree = dict(sorted(hash_tree(common).items()))
+    return {
+        "hash" : "sha256",
+        "common" : { path : entry.digest for path, entry in tree.items()
+                            if not path.endswith('/') and entry.link is None },
+        "common_symlinks" : { path : entry.link for path, entry in tree.items() if entry.link is not None },
+    }
+
+def overlay_manifest(common: str, variants: Dict[str, VariantOutput]) -> Dict[str, Any]:
+    """ Describes every variant's workspace as the common tree with the variant's files
+        laid over it, by path and sha256, so that the grader can assemble a workspace
+        from links to content it already has instead of copying the tree for each run
+    """
+    return {
+        **common_manifest(common),
+        "variants" : { variant : output.digests for variant, output in variants.items() }
+    }
+
+def refresh_overlay(q_root: str, common: str) -> None:
+    """Brings the overlay manifest of the question at `q_root` up to date after its common files were relinked"""
+    meta_path = f"{q_root}/tests/meta.json"
+    with open(meta_path, 'r') as f:
+        meta = json_loads(f.read())
+    meta.setdefault("overlay", dict()).update(common_manifest(common))
+    write_if_changed(meta_path, json_dumps(meta))
 
-def write_metadata(q_root: str, summary: dict) -> None:
-    write_to(
-        f"{q_root}/tests/meta.json", 
+def write_metadata(writer: Writer, summary: dict, common: str, variants: Dict[str, VariantOutput]) -> int:
+    """ Writes tests/meta.json, with the tests each of `variants` (from `generate_variants`)
+        leaves out of grading and the overlay manifest of the tree under `common`
+    """
+    return writer.write(
+        "tests/meta.json", 
         json_dumps({ 
             "submission_file" : summary["submit_to"], 
             "submission_root" : "",
             "pre-text" : summary["solution"]["pre"],
             "post-text" : summary["solution"]["post"],
             "grading_exclusions" : {
-                var : details.get("exclude", [])
-                for var, details in summary["mutations"].items()
-            }
+                variant : output.exclude
+                for variant, output in variants.items()
+            },
+            "overlay" : overlay_manifest(common, variants)
         })
     )
 
-def clean_up(question_root: str) -> None:
-    # TODO: remove all files and make it look like we were never here
-    print(f"Removing output directory: {question_root}")
-    os.system(f"rm -rf {question_root}")
-    print("Exiting.")
-    exit(1)
+def check_fields(yaml_file: str, content: Dict[str, Any]) -> None:
+    """ Raises a QuestionError if the `solution:` or `mutations:` of a question are
+        not shaped as the build expects, before anything of it is written
+    """
+    solution = content["solution"]
+    if not isinstance(solution, dict) or not all(isinstance(solution.get(k), str) for k in ("pre", "lines", "post")):
+        raise QuestionError(f"{yaml_file}: `solution:` needs `pre`, `lines` and `post` strings")
 
-def main():
-    if len(argv) <= 3:
-        print(f"USAGE: {argv[0]} <destination> <application root> <question1_data.yaml> [<question2_data.yaml> <question3_data.yaml> ...]")
-        exit(1)
+    variants = content.get("mutations", {})
+    if variants is None:
+        return
+    if not isinstance(variants, dict):
+        raise QuestionError(f"{yaml_file}: `mutations:` must map variant names to their mutations")
+    for variant, data in variants.items():
+        files = data.get("files") if isinstance(data, dict) else None
+        if not isinstance(files, dict) or not all(isinstance(d, str) for d in files.values()):
+            raise QuestionError(f"{yaml_file}: variant {variant} needs a `files:` mapping of common files to diffs")
+        if not isinstance(data.get("exclude") or [], list):
+            raise QuestionError(f"{yaml_file}: the `exclude:` of variant {variant} must be a list of tests")
 
-    destination = argv[1]
-    common = argv[2]
-    yaml_paths = argv[3:]
-    for yaml_path in yaml_paths:
-        yaml_file = os.path.basename(yaml_path)
-        q_name = yaml_file[:yaml_file.index('.')]
-        q_root = f"{destination}/{q_name}/"
-
-        content: Dict[str, Any] = yaml.safe_load(open(f"{yaml_path}"))
-
-        assert "solution" in content.keys(), f"`solution:` is a required field in question.yaml"
-        assert "submit_to" in content.keys(), f"`submit_to:` is a required field in question.yaml"
-        # the other two fields are normally "mutations" and ""
-
-        prompt: str = content.get("prompt", "")
-        make_parson_source(destination, prompt, content["solution"], q_name)
-        
-        print(f"Running FPP generator")
-        if True:
-            import generate_fpp
-            args = generate_fpp.parse_args(["--no-parse", f"{destination}/{q_name}.py"])
-            if args.profile:
-                generate_fpp.profile_generate_many(args)
-            else:
-                generate_fpp.generate_many(args)
-            os.system(f"rm {destination}/{q_name}.py")
+def build_question(destination: str, spec: QuestionSpec, variant_jobs: int = None,
+                   archive: 'Archive' = None) -> None:
+    """ Builds the question described by `spec` into `destination`, or streams
+        it into `archive` when one is given. Exits if it cannot be built as written.
+    """
+    with TRACER.span("question", question=spec.name):
+        try:
+            _build_question(destination, spec, variant_jobs, archive)
+        except BuildError as e:
+            # nothing reaches the question until it is committed, so the last good build survives
+            Bcolors.fail(e)
+            print(f"Discarding the partial build of {spec.name}")
+            print("Exiting.")
+            exit(1)
+    Bcolors.printf(Bcolors.OKGREEN, 'Done.')
+
+def _build_question(destination: str, spec: QuestionSpec, variant_jobs: int = None,
+                    archive: 'Archive' = None, progress: Progress = PRINT_PROGRESS) -> bool:
+    """ Builds the question described by `spec` (see `build_question`), returning whether
+        any of its files changed. Raises a BuildError if it cannot be built as written.
+        Reports its steps to `progress`, printing nothing itself.
+    """
+    q_name = spec.name
+    # every file goes through the writer, which only replaces the question if it changed
+    if archive is not None:
+        writer, uuid = archive.question(q_name), archive.uuids.get(q_name)
+    else:
+        writer = QuestionWriter(f"{destination}/{q_name}")
+        uuid = existing_uuid(writer.root)
+    try:
+        _write_question(writer, destination, spec, variant_jobs, uuid, progress)
+    except BaseException:
+        writer.abort()
+        raise
 
-        print(f"- Overwriting info.json")
-        write_to(f"{q_root}/info.json", base_info_json())
+    with TRACER.span("commit", question=q_name) as span:
+        span["bytes"] = writer.bytes_written
+        changed = writer.commit()
+    if not changed:
+        progress.info(f"- {q_name} is unchanged, left as it was")
+    return changed
 
-        safe_mkdir(f"{q_root}/tests")
+def _write_question(writer: Writer, destination: str, spec: QuestionSpec,
+                    variant_jobs: int = None, uuid: str = None, progress: Progress = PRINT_PROGRESS) -> None:
+    from .generate_fpp import generate_fpp_files
 
-        # instructor solution    
-        print(f"- Preparing solution")
-        safe_mkdir(f"{q_root}/tests/solution")
-        write_solution(
-            q_root, 
+    yaml_path, common = spec.yaml_path, spec.app_root
+    yaml_file = os.path.basename(yaml_path)
+    q_name = spec.name
+
+    with TRACER.span("load yaml", question=q_name, files=1) as span:
+        with open(yaml_path, 'rb') as f:
+            data = f.read()
+        span["bytes"] = len(data)
+        try:
+            document = parse_yaml(data)
+        except ValueError as e:
+            raise QuestionError(f"{yaml_file}: {e}") from e
+        if not isinstance(document, dict):
+            raise QuestionError(f"{yaml_file}: expected a mapping of question fields")
+        # the question's own fields win over the defaults of its course
+        content: Dict[str, Any] = { **spec.defaults, **document }
+
+    for required in ("solution", "submit_to"):
+        if required not in content:
+            raise QuestionError(f"{yaml_file}: `{required}:` is a required field in question.yaml")
+    # the other two fields are normally "mutations" and ""
+    check_fields(yaml_file, content)
+
+    try:
+        override = timeout_override(content.get("timeout"))
+    except ValueError as e:
+        raise QuestionError(f"{yaml_file}: {e}") from e
+
+    prompt: str = content.get("prompt", "")
+
+    progress.info(f"Running FPP generator")
+    with TRACER.span("fpp generation", question=q_name, bytes=0) as span:
+        fpp_files = generate_fpp_files(
+            prompt,
+            content["solution"],
+            source_code=make_parson_source(prompt, content["solution"]),
+            no_parse=True
+        )
+        # the instructor solution below takes the place of the generated tests/ans.py
+        del fpp_files["tests/ans.py"]
+        for rel_path, text in fpp_files.items():
+            span["bytes"] += writer.write(rel_path, text)
+        span["files"] = len(fpp_files)
+
+    # instructor solution    
+    progress.info(f"- Preparing solution")
+    with TRACER.span("solution", question=q_name, files=2) as span:
+        span["bytes"] = write_solution(
+            writer, 
             "\n".join([
                 content["solution"]["pre"], 
                 content["solution"]["lines"], 
@@ -144,29 +381,362 @@ def main():
             ])
         )
 
-        # load common files
-        print(f"- Loading common files")
-        safe_mkdir(f"{q_root}/tests/common")
-        os.system(f"cp -r {common}/* {q_root}/tests/common/")
-
-        # load mutations (if any)
-        print(f"- Producing mutations")
-        mutations = content.get('mutations', [])
-        if mutations is not None:
-            try:
-                generate_variants(q_root, mutations)
-            except RuntimeError as e:
-                print(e.args[0])
-                clean_up(q_root)
+    # load common files
+    progress.info(f"- Loading common files")
+    with TRACER.span("common copy", question=q_name) as span:
+        span["files"] = writer.materialize("tests/common", common, f"{destination}/{STORE_DIR}")
+        span["bytes"] = sum(entry.size for entry in hash_tree(common).values())
+
+    # load mutations (if any)
+    progress.info(f"- Producing mutations")
+    mutations = content.get('mutations', {})
+    written: Dict[str, VariantOutput] = dict()
+    if mutations is not None:
+        with TRACER.span("variants", question=q_name, variants=len(mutations)):
+            written = generate_variants(writer, mutations, variant_jobs, progress)
+    else:
+        progress.info(f"No mutations found for {yaml_file}: generating no mutations")
+
+    # the timeout depends on the variants left once duplicates are merged
+    common_entries = [e for rel_path, e in hash_tree(common).items() if not rel_path.endswith('/') and e.link is None]
+    cost = GradingCost(
+        variants=len(written),
+        mutated_files=sum(len(output.digests) for output in written.values()),
+        common_files=len(common_entries),
+        common_bytes=sum(e.size for e in common_entries),
+        override=override
+    )
+    progress.info(f"- Grading cost: {cost}")
+    progress.info(f"- Overwriting info.json")
+    with TRACER.span("info.json", question=q_name, files=1, timeout=cost.timeout) as span:
+        # keep the uuid stable across rebuilds, PrairieLearn keys questions on it
+        span["bytes"] = writer.write("info.json", base_info_json(uuid, cost.timeout))
+
+    # load metadata (like what file the submission maps to)
+    progress.info(f"- Writing grader metadata")
+    with TRACER.span("metadata", question=q_name, files=1) as span:
+        span["bytes"] = write_metadata(writer, content, common, written)
+
+def build_captured(destination: str, spec: QuestionSpec,
+                   variant_jobs: int = None) -> Tuple[bool, str, List[Dict], Dict[str, List[int]]]:
+    """ Runs `build_question`, capturing everything it prints so that parallel
+        builds can report each question's output as one group.
+        Returns whether the build succeeded, its output, its trace spans and
+        its disk cache lookups.
+    """
+    from traceback import print_exc
+
+    # forked workers inherit whatever the parent had recorded
+    TRACER.drain()
+    DiskCache.drain_stats()
+    log = StringIO()
+    with redirect_stdout(log), redirect_stderr(log):
+        try:
+            build_question(destination, spec, variant_jobs)
+            return True, log.getvalue(), TRACER.drain(), DiskCache.drain_stats()
+        except SystemExit:
+            pass
+        except Exception:
+            print_exc()
+    return False, log.getvalue(), TRACER.drain(), DiskCache.drain_stats()
+
+def build_parallel(destination: str, specs: List[QuestionSpec], jobs: int,
+                   variant_jobs: int = None) -> List[QuestionSpec]:
+    """ Builds each question on a pool of `jobs` processes, printing their output
+        in the order given. Returns the questions that failed.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    # hash and store each application tree once, up front, for every worker to share
+    with TRACER.span("common store"):
+        for app_root in dict.fromkeys(spec.app_root for spec in specs):
+            populate_store(app_root, f"{destination}/{STORE_DIR}")
+
+    failures = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(build_captured, destination, spec, variant_jobs) for spec in specs]
+        for spec, future in zip(specs, futures):
+            ok, log, events, cache_stats = future.result()
+            TRACER.extend(events)
+            DiskCache.merge_stats(cache_stats)
+            Bcolors.printf(Bcolors.OKBLUE, f"==> {spec.yaml_path}")
+            print(log, end='')
+            if not ok:
+                failures.append(spec)
+    return failures
+
+def parse_args(args: List[str] = None) -> Namespace:
+    parser = ArgumentParser(
+        prog="rspecFppGen",
+        description="Generates autograder-friendly formatted files for rspec fpp questions"
+    )
+    parser.add_argument("destination")
+    parser.add_argument("common", metavar="application_root", nargs="?")
+    parser.add_argument("yaml_paths", metavar="question_data.yaml", nargs="*",
+                        help="question YAMLs, directories of them or (quoted) globs such as 'questions/**/*.yaml'")
+    parser.add_argument("--course", metavar="course.yaml",
+                        help="build every question listed in a course manifest, in place of "
+                             "<application_root> and the question YAMLs")
+    parser.add_argument("-j", "--jobs", type=int, default=1, metavar="N",
+                        help="build up to N questions at once on a process pool")
+    parser.add_argument("--variant-jobs", type=int, default=None, metavar="N",
+                        help="produce up to N variants of a question at once (default: one per core)")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="rebuild every question, even those unchanged since the last build")
+    parser.add_argument("--watch", action="store_true",
+                        help="stay running, rebuilding only the questions affected by each change")
+    parser.add_argument("--no-preflight", dest="preflight", action="store_false",
+                        help="skip checking that every mutation applies before writing anything")
+    parser.add_argument("--no-cache", dest="cache", action="store_false",
+                        help="neither read nor fill the on-disk cache of parsed YAML and checked mutations")
+    parser.add_argument("--archive", metavar="out.tar.zst",
+                        help="stream the questions into a .tar[.gz|.bz2|.xz|.zst] or .zip archive, under "
+                             "<destination> inside it, instead of writing them to disk")
+    parser.add_argument("--trace", metavar="trace.json",
+                        help="write a Chrome trace-event file timing each stage, and print a summary")
+    parsed = parser.parse_args(args)
+    if parsed.archive and parsed.watch:
+        parser.error("--watch cannot be combined with --archive")
+    DiskCache.enabled = parsed.cache
+
+    try:
+        if parsed.course:
+            if parsed.common:
+                parser.error("--course lists the application roots and questions, pass neither alongside it")
+            parsed.specs = load_course(parsed.course)
+        elif parsed.common and parsed.yaml_paths:
+            parsed.specs = [QuestionSpec(p, parsed.common) for p in expand_yaml_paths(parsed.yaml_paths)]
         else:
-            print(f"No mutations found for {yaml_file}: generating no mutations")
+            parser.error("expected an application root and at least one question YAML, or --course")
+    except CourseError as e:
+        parser.error(e.args[0])
+    return parsed
+
+def main():
+    args = parse_args()
+    try:
+        build_all(args)
+        if not args.archive:
+            prune_store(f"{args.destination}/{STORE_DIR}")
+        cache_summary = DiskCache.summary()
+        if cache_summary:
+            print(cache_summary)
+        if args.watch:
+            watch(args)
+    finally:
+        if args.trace:
+            TRACER.write(args.trace)
+            print(TRACER.summary())
+            print(f"Wrote trace to {args.trace}")
+
+def build_all(args: Namespace) -> None:
+    destination, specs = args.destination, args.specs
+    # the files mutations patch are built from whatever the .fppignore rules say
+    for spec in specs:
+        retain_paths(spec.app_root, mutation_targets(spec.yaml_path))
+    if args.archive:
+        return build_archive(args)
+
+    # two questions of the same name would build into (and record) the same directory
+    clashes = name_clashes(specs)
+    if clashes:
+        Bcolors.fail(f"Cannot build, several questions share a name: {', '.join(clashes)}")
+        exit(1)
+
+    # skip questions whose yaml, application tree and tool are all unchanged
+    manifest = BuildManifest(destination)
+    with TRACER.span("fingerprint", files=len(specs)):
+        fingerprints = { s.name: question_fingerprint(s.yaml_path, s.app_root, s.defaults) for s in specs }
+    stale = []
+    for spec in specs:
+        if not args.force and manifest.is_current(spec.name, fingerprints[spec.name]):
+            print(f"Skipping {spec.name}: unchanged since the last build")
+        else:
+            stale.append(spec)
+
+    # a broken hunk anywhere fails the whole batch before anything is written
+    if args.preflight and not check_mutations(stale):
+        exit(1)
+
+    if args.jobs <= 1:
+        for spec in stale:
+            manifest.forget(spec.name)
+            build_question(destination, spec, args.variant_jobs)
+            manifest.record(spec.name, fingerprints[spec.name], spec.yaml_path)
+        return
+
+    for spec in stale:
+        manifest.forget(spec.name)
+    failures = build_parallel(destination, stale, args.jobs, args.variant_jobs)
+    for spec in stale:
+        if spec not in failures:
+            manifest.record(spec.name, fingerprints[spec.name], spec.yaml_path)
+
+    built = len(stale) - len(failures)
+    Bcolors.printf(Bcolors.OKGREEN if not failures else Bcolors.WARNING,
+                   f"Built {built} of {len(stale)} changed questions with {args.jobs} jobs "
+                   f"({len(specs) - len(stale)} unchanged)")
+    for spec in failures:
+        Bcolors.fail(f"- failed: {spec.yaml_path}")
+    if failures:
+        exit(1)
+
+def name_clashes(specs: List[QuestionSpec]) -> List[str]:
+    """Returns the question names that more than one of `specs` would be built as"""
+    names = [spec.name for spec in specs]
+    return sorted({ n for n in names if names.count(n) > 1 })
+
+def build_archive(args: Namespace) -> None:
+    """ Streams every question into the archive `args.archive`, one at a time.
+        The archive only replaces an earlier one once every question built.
+    """
+    from .archive import Archive, ArchiveError
+
+    destination, specs = args.destination, args.specs
+    if args.jobs > 1:
+        Bcolors.warn(f"Ignoring --jobs {args.jobs}: questions are streamed into the archive one at a time")
+    clashes = name_clashes(specs)
+    if clashes:
+        Bcolors.fail(f"Cannot archive, several questions share a name: {', '.join(clashes)}")
+        exit(1)
+    if args.preflight and not check_mutations(specs):
+        exit(1)
+
+    try:
+        archive = Archive(args.archive, destination)
+    except (ArchiveError, OSError) as e:
+        Bcolors.fail(e)
+        exit(1)
+    ok = False
+    try:
+        with TRACER.span("archive", files=0, bytes=0) as span:
+            for spec in specs:
+                build_question(destination, spec, args.variant_jobs, archive)
+            span["files"], span["bytes"] = archive.files, archive.bytes
+        ok = True
+    finally:
+        kept = archive.close(ok)
+        if not kept:
+            Bcolors.fail(f"Left {args.archive} as it was: a question failed to build")
+    if not kept:
+        exit(1)
+    Bcolors.printf(Bcolors.OKGREEN, f"Wrote {len(specs)} questions to {args.archive}: {archive.files} files "
+                                    f"({archive.bytes} bytes) and {archive.links} links to identical files")
+
+def check_mutations(specs: List[QuestionSpec]) -> bool:
+    """ Applies every mutation of `specs` in memory, reporting each failure
+        with its place in the YAML. Returns whether they all applied.
+    """
+    from .preflight import MutationFailure, preflight
+
+    with TRACER.span("preflight", files=len(specs)):
+        failures: List[MutationFailure] = preflight(specs)
+    if failures:
+        questions = len({ f.yaml_path for f in failures })
+        Bcolors.fail(f"Found {len(failures)} broken mutation(s) in {questions} question(s), nothing was written:")
+        for failure in failures:
+            print(f"  {failure}")
+    return not failures
+
+def mutation_targets(yaml_path: str) -> Set[str]:
+    """Returns the common files the mutations of `yaml_path` patch"""
+    try:
+        content = load_yaml(yaml_path) or {}
+    except (OSError, ValueError):
+        return set()
+    variants = content.get("mutations") or {}
+    return { file for data in variants.values() if isinstance(data, dict)
+                  for file in (data.get("files") or {}) }
+
+def watch(args: Namespace) -> None:
+    """ Stays resident after the first build, rebuilding only what each change affects:
+        a question whose yaml changed, or one of whose mutation targets changed, is
+        rebuilt in full; other questions only have the changed common files relinked.
+        Hashes of the application trees and the store are kept warm between rebuilds.
+    """
+    from time import perf_counter
+    from traceback import print_exc
+    from .watch import make_watcher
+
+    destination, specs = args.destination, args.specs
+    store = f"{destination}/{STORE_DIR}"
+    app_roots = { os.path.realpath(root): root for root in dict.fromkeys(s.app_root for s in specs) }
+    by_real_path = { os.path.realpath(s.yaml_path): s for s in specs }
+    targets = { s.name: mutation_targets(s.yaml_path) for s in specs }
+    manifest = BuildManifest(destination)
+    # questions whose last rebuild failed, so still hold the build before it
+    failed: Set[str] = set()
+
+    watcher = make_watcher([s.yaml_path for s in specs], list(app_roots.values()))
+    Bcolors.printf(Bcolors.OKBLUE, f"Watching {len(specs)} questions and {', '.join(app_roots.values())} "
+                                   f"({type(watcher).__name__}), press Ctrl-C to stop")
+    try:
+        while True:
+            changed = watcher.wait()
+            if changed is not None and not changed:
+                continue
+            start = perf_counter()
+
+            # the changed paths of each application tree
+            app_changes: Dict[str, Set[str]] = dict()
+            if changed is None:
+                # the watcher lost events, so assume everything changed
+                Bcolors.warn("Lost track of changes, rebuilding everything")
+                edited = { s.name for s in specs }
+                for root in app_roots.values():
+                    forget_tree(root)
+                    app_changes[root] = set(hash_tree(root))
+            else:
+                edited = { by_real_path[p].name for p in changed if p in by_real_path }
+                for real_root, root in app_roots.items():
+                    app_changes[root] = refresh_tree(root, [
+                        os.path.relpath(p, real_root) for p in changed if p.startswith(real_root + os.sep)
+                    ])
+            for spec in specs:
+                if spec.name in edited:
+                    targets[spec.name] = mutation_targets(spec.yaml_path)
+                    app_changes[spec.app_root] |= retain_paths(spec.app_root, targets[spec.name])
+            if any(app_changes.values()):
+                tree_fingerprint.cache_clear()
 
-        # load metadata (like what file the submission maps to)
-        print(f"- Writing grader metadata")
-        write_metadata(q_root, content)
+            rebuilt, relinked = 0, 0
+            for spec in specs:
+                q_name, changes = spec.name, app_changes[spec.app_root]
+                q_common = f"{destination}/{q_name}/tests/common"
+                # a question whose last build failed has nothing current to relink into
+                if q_name in edited or targets[q_name] & changes \
+                        or changes and (q_name in failed or not os.path.isdir(q_common)):
+                    manifest.forget(q_name)
+                    failed.add(q_name)
+                    if args.preflight and not check_mutations([spec]):
+                        continue
+                    try:
+                        build_question(destination, spec, args.variant_jobs)
+                    except SystemExit:
+                        continue
+                    except Exception:
+                        print_exc()
+                        continue
+                    failed.discard(q_name)
+                    rebuilt += 1
+                elif changes:
+                    materialize_paths(spec.app_root, q_common, store, changes)
+                    refresh_overlay(f"{destination}/{q_name}", spec.app_root)
+                    relinked += 1
+                else:
+                    continue
+                manifest.record(q_name, question_fingerprint(spec.yaml_path, spec.app_root, spec.defaults),
+                                spec.yaml_path)
 
-        from io_helpers import Bcolors
-        Bcolors.printf(Bcolors.OKGREEN, 'Done.')
+            if rebuilt or relinked:
+                # the content replaced by an edit is no longer linked from anywhere
+                prune_store(store)
+                Bcolors.printf(Bcolors.OKGREEN, f"Rebuilt {rebuilt} and relinked common files of {relinked} "
+                                                f"questions in {perf_counter() - start:.2f}s")
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    finally:
+        watcher.close()
 
 if __name__ == "__main__":
     main()
@@ -2,10 +2,16 @@ from setuptools import setup
 
 setup(
     name="rspecFppGen",
-    version = "0.1",
+    version = "0.1",  # keep in sync with consts.TOOL_VERSION
     author = "Nelson Lojo",
     author_email = "nelson.lojo@berkeley.edu",
     description = "Generates autograder-friendly formatted files for rspec fpp questions",
-    packages = ['.'],
-    install_requires=['pyyaml']
+    packages = ['rspecFppGen'],
+    package_dir = { 'rspecFppGen': '.' },
+    entry_points = { 'console_scripts': [
+        'rspecFppGen = rspecFppGen.rspecFppGen:main',
+        'rspecFppGen-mutants = rspecFppGen.mutants:main',
+    ] },
+    install_requires=['pyyaml'],
+    extras_require={ 'zstd': ['zstandard'] }
 )
@@ -0,0 +1,86 @@
+from typing import *
+
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from json import dumps
+from threading import get_ident
+from time import perf_counter_ns
+
+# the spans recorded by the `Tracer.collect` block running in this context, if any
+_collected: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar('collected', default=None)
+
+
+class Tracer:
+    """ Records a span for each stage of a build, in Chrome's trace-event format
+        (load the JSON written by `write` into chrome://tracing or Perfetto).
+        Spans carry arbitrary arguments, conventionally `bytes` and `files`.
+    """
+
+    def __init__(self) -> None:
+        self.events: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def span(self, name: str, **args) -> Iterator[Dict[str, Any]]:
+        """ Times the body of the `with` block as a span called `name`.
+            Yields the span's arguments so the body can fill in `bytes` and `files`.
+        """
+        start = perf_counter_ns()
+        try:
+            yield args
+        finally:
+            end = perf_counter_ns()
+            collected = _collected.get()
+            # list.append is atomic, so threads may record spans concurrently
+            (self.events if collected is None else collected).append({
+                'name': name, 'cat': 'build', 'ph': 'X',
+                'ts': start / 1000, 'dur': (end - start) / 1000,
+                'pid': os.getpid(), 'tid': get_ident(),
+                'args': args,
+            })
+
+    @contextmanager
+    def collect(self) -> Iterator[List[Dict[str, Any]]]:
+        """ Records the spans of the `with` block into the list yielded rather than
+            `events`, so that builds on several threads each keep their own. Tasks the
+            block hands to a thread pool are included when run in a copy of its context
+            (`pool.submit(copy_context().run, fn, ...)`).
+        """
+        events: List[Dict[str, Any]] = []
+        token = _collected.set(events)
+        try:
+            yield events
+        finally:
+            _collected.reset(token)
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Removes and returns every recorded span (for handing back from a worker)"""
+        events, self.events = self.events, []
+        return events
+
+    def extend(self, events: List[Dict[str, Any]]) -> None:
+        self.events.extend(events)
+
+    def write(self, path: str) -> None:
+        with open(path, 'w') as f:
+            f.write(dumps({ 'traceEvents': self.events, 'displayTimeUnit': 'ms' }))
+
+    def summary(self) -> str:
+        """Returns a table of the time, bytes and files of each kind of span, slowest first"""
+        totals: Dict[str, List[float]] = dict()
+        for e in self.events:
+            row = totals.setdefault(e['name'], [0, 0.0, 0, 0])
+            row[0] += 1
+            row[1] += e['dur'] / 1e6
+            row[2] += e['args'].get('bytes', 0)
+            row[3] += e['args'].get('files', 0)
+
+        width = max([len('stage')] + list(map(len, totals)))
+        lines = [f"{'stage':<{width}} {'count':>6} {'seconds':>9} {'bytes':>12} {'files':>7}"]
+        for name, (count, seconds, n_bytes, files) in sorted(totals.items(), key=lambda t: -t[1][1]):
+            lines.append(f"{name:<{width}} {count:>6} {seconds:>9.3f} {n_bytes:>12} {files:>7}")
+        return '\n'.join(lines)
+
+
+# the tracer every stage of this process records into
+TRACER: Final[Tracer] = Tracer()
@@ -0,0 +1,194 @@
+from typing import *
+
+import ctypes
+import os
+from abc import ABC, abstractmethod
+from ctypes.util import find_library
+from select import select
+from struct import calcsize, unpack_from
+from time import monotonic, sleep
+
+from .ignore import IGNORE_FILE
+from .materialize import pruned_dir
+
+# inotify(7) event bits
+IN_CLOSE_WRITE: Final[int] = 0x00000008
+IN_MOVED_FROM: Final[int] = 0x00000040
+IN_MOVED_TO: Final[int] = 0x00000080
+IN_CREATE: Final[int] = 0x00000100
+IN_DELETE: Final[int] = 0x00000200
+IN_Q_OVERFLOW: Final[int] = 0x00004000
+IN_ISDIR: Final[int] = 0x40000000
+WATCH_MASK: Final[int] = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+EVENT_HEADER: Final[str] = 'iIII'
+
+# how long to keep collecting events after the first, so one save is one rebuild
+SETTLE_SECONDS: Final[float] = 0.05
+
+
+class Watcher(ABC):
+    """ Watches files and (recursively) directories, reporting the absolute paths
+        that changed. `wait` returns None when it lost track of what changed and
+        everything should be treated as modified.
+    """
+
+    def __init__(self, files: List[str], dirs: List[str]) -> None:
+        self.files = set(map(os.path.realpath, files))
+        self.dirs = list(map(os.path.realpath, dirs))
+
+    def _walk(self, path: str) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """ `os.walk` of `path` (in one of the watched trees), leaving out what the build
+            leaves out: hidden entries at the top of the tree and the directories its
+            ignore rules prune (see materialize.py)
+        """
+        root = next(d for d in self.dirs if path == d or path.startswith(d + os.sep))
+        if path != root and pruned_dir(root, os.path.relpath(path, root)):
+            return
+        for dir_path, dir_names, file_names in os.walk(path):
+            if dir_path == root:
+                dir_names[:] = [d for d in dir_names if not d.startswith('.')]
+            dir_names[:] = [d for d in dir_names
+                            if not pruned_dir(root, os.path.relpath(os.path.join(dir_path, d), root))]
+            yield dir_path, dir_names, file_names
+
+    @abstractmethod
+    def wait(self, timeout: float = None) -> Optional[Set[str]]:
+        """ Blocks until something changes (or `timeout` seconds pass), returning the
+            changed paths, or None if they are unknown
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher(Watcher):
+    """Linux watcher on top of inotify(7), called through ctypes"""
+
+    def __init__(self, files: List[str], dirs: List[str]) -> None:
+        super().__init__(files, dirs)
+        self.libc = ctypes.CDLL(find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.watches: Dict[int, str] = dict()
+        # trees whose ignore rules changed, so whose directories are watched afresh
+        self.rescan: Set[str] = set()
+
+        # editors often replace files by renaming, so watch their directories
+        for parent in { os.path.dirname(f) for f in self.files }:
+            self._add(parent)
+        for root in self.dirs:
+            self._add_tree(root)
+
+    def _add(self, path: str) -> None:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"could not watch {path}")
+        self.watches[wd] = path
+
+    def _add_tree(self, root: str) -> List[str]:
+        """Watches `root` and every directory under it the build reads, returning the files found"""
+        found = []
+        for dir_path, _, file_names in self._walk(root):
+            self._add(dir_path)
+            found.extend(os.path.join(dir_path, f) for f in file_names)
+        return found
+
+    def _watched(self, path: str) -> bool:
+        return path in self.files or any(path == d or path.startswith(d + os.sep) for d in self.dirs)
+
+    def _read(self) -> Optional[Set[str]]:
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset, header = 0, calcsize(EVENT_HEADER)
+        while offset < len(data):
+            wd, mask, _, length = unpack_from(EVENT_HEADER, data, offset)
+            name = data[offset + header:offset + header + length].rstrip(b'\0')
+            offset += header + length
+
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if wd not in self.watches:
+                continue
+            path = os.path.join(self.watches[wd], os.fsdecode(name))
+            if not self._watched(path):
+                continue
+            changed.add(path)
+            if os.path.basename(path) == IGNORE_FILE and os.path.dirname(path) in self.dirs:
+                self.rescan.add(os.path.dirname(path))
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                changed.update(self._add_tree(path))
+        return changed
+
+    def wait(self, timeout: float = None) -> Optional[Set[str]]:
+        # by now the build has reloaded the rules, and may read directories they pruned
+        for root in self.rescan:
+            self._add_tree(root)
+        self.rescan.clear()
+
+        ready, _, _ = select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        changed = self._read()
+        deadline = monotonic() + SETTLE_SECONDS
+        while changed is not None and monotonic() < deadline:
+            ready, _, _ = select([self.fd], [], [], max(0, deadline - monotonic()))
+            if ready:
+                more = self._read()
+                changed = None if more is None else changed | more
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher(Watcher):
+    """Portable fallback that compares mtimes and sizes every `interval` seconds"""
+
+    def __init__(self, files: List[str], dirs: List[str], interval: float = 0.5) -> None:
+        super().__init__(files, dirs)
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        stamps = dict()
+
+        def stamp(path: str) -> None:
+            try:
+                st = os.lstat(path)
+                stamps[path] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                pass
+
+        for path in self.files:
+            stamp(path)
+        for root in self.dirs:
+            for dir_path, _, file_names in self._walk(root):
+                for name in file_names:
+                    stamp(os.path.join(dir_path, name))
+        return stamps
+
+    def wait(self, timeout: float = None) -> Optional[Set[str]]:
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            sleep(self.interval)
+            snapshot = self._scan()
+            changed = { p for p in snapshot.keys() | self.snapshot.keys()
+                        if snapshot.get(p) != self.snapshot.get(p) }
+            self.snapshot = snapshot
+            if changed or (deadline is not None and monotonic() >= deadline):
+                return changed
+
+
+def make_watcher(files: List[str], dirs: List[str]) -> Watcher:
+    """Returns an inotify watcher where the platform supports it, else a polling one"""
+    try:
+        return InotifyWatcher(files, dirs)
+    except (OSError, AttributeError):
+        return PollingWatcher(files, dirs)
@@ -0,0 +1,32 @@
+import os
+from json import dumps
+
+from rspecFppGen.fingerprint import tree_fingerprint
+from rspecFppGen.materialize import forget_tree, hash_tree, refresh_tree
+from rspecFppGen.rspecFppGen import common_manifest
+
+
+def make_app(root) -> str:
+    for rel_path in ('Gemfile', 'app/models/user.rb', 'lib/b.rb', 'spec/user_spec.rb'):
+        os.makedirs(root / os.path.dirname(rel_path), exist_ok=True)
+        (root / rel_path).write_text(f"# {rel_path}\n")
+    return str(root)
+
+
+def test_refreshed_tree_fingerprints_as_a_fresh_one(tmp_path):
+    app = make_app(tmp_path)
+    hash_tree(app)
+    try:
+        os.makedirs(tmp_path / 'lib2')
+        (tmp_path / 'lib2' / 'a.rb').write_text('# new\n')
+        (tmp_path / 'Gemfile').write_text('# edited\n')
+        assert refresh_tree(app, ['lib2', 'Gemfile'])
+        tree_fingerprint.cache_clear()
+        refreshed = tree_fingerprint(app), dumps(common_manifest(app))
+
+        forget_tree(app)
+        tree_fingerprint.cache_clear()
+        assert (tree_fingerprint(app), dumps(common_manifest(app))) == refreshed
+    finally:
+        forget_tree(app)
+        tree_fingerprint.cache_clear()
@@ -0,0 +1,142 @@
+import os
+from shutil import which
+from subprocess import run
+
+import pytest
+
+from rspecFppGen.ignore import IgnoreRules, parse_rule
+
+
+def rules(*lines: str) -> IgnoreRules:
+    return IgnoreRules(lines)
+
+
+@pytest.mark.parametrize('line', ['', '   ', '# comment', '/', '!'])
+def test_blank_and_comment_lines_are_not_rules(line):
+    assert parse_rule(line) is None
+
+
+@pytest.mark.parametrize('path, is_dir, expected', [
+    ('vendor/bundle', True, True),
+    ('vendor/bundle/ruby/gem.rb', False, True),
+    # anchored: only at the root
+    ('engines/vendor/bundle', True, False),
+    # directory-only: a file of that name stays
+    ('log', False, False),
+    ('log', True, True),
+    ('app/log', True, False),
+    # unanchored: at any depth
+    ('ext/native.so', False, True),
+    ('lib/deep/er/thing.o', False, True),
+    ('pkg/rails-7.0.gem', False, True),
+    ('app/models/user.rb', False, False),
+])
+def test_default_rules(path, is_dir, expected):
+    assert rules().excluded(path, is_dir) == expected
+
+
+@pytest.mark.parametrize('rule, path, is_dir, expected', [
+    # a slash in the middle anchors the pattern too
+    ('doc/api', 'doc/api', True, True),
+    ('doc/api', 'engines/doc/api', True, False),
+    ('/coverage', 'coverage', True, True),
+    ('/coverage', 'spec/coverage', True, False),
+    ('coverage', 'spec/coverage', True, True),
+    ('*.log', 'a/b/c.log', False, True),
+    ('c?.txt', 'c1.txt', False, True),
+    ('c?.txt', 'c10.txt', False, False),
+    ('[ab].rb', 'b.rb', False, True),
+    ('[!ab].rb', 'b.rb', False, False),
+    ('[!ab].rb', 'c.rb', False, True),
+    # `*` does not cross directories
+    ('app/*.rb', 'app/models/user.rb', False, False),
+    ('app/*.rb', 'app/user.rb', False, True),
+    # leading `**/`: at any depth, including the root
+    ('**/fixtures', 'fixtures', True, True),
+    ('**/fixtures', 'spec/deep/fixtures', True, True),
+    # trailing `/**`: everything inside, not the directory itself
+    ('assets/**', 'assets/images/a.png', False, True),
+    ('assets/**', 'assets', True, False),
+    # `/**/`: any number of directories in between
+    ('spec/**/cache', 'spec/cache', True, True),
+    ('spec/**/cache', 'spec/a/b/cache', True, True),
+    ('spec/**/cache', 'other/spec/cache', True, False),
+    (r'\#hash', '#hash', False, True),
+    (r'\!bang', '!bang', False, True),
+])
+def test_patterns(rule, path, is_dir, expected):
+    assert rules(rule).excluded(path, is_dir) == expected
+
+
+def test_last_matching_rule_wins():
+    r = rules('*.rb', '!keep.rb')
+    assert r.excluded('lib/drop.rb', False)
+    assert not r.excluded('lib/keep.rb', False)
+    assert rules('!keep.rb', '*.rb').excluded('lib/keep.rb', False)
+
+
+def test_negation_brings_back_a_default():
+    r = rules('!/log/')
+    assert not r.excluded('log', True)
+    assert not r.excluded('log/development.log', False)
+    assert not rules('!*.so').excluded('ext/native.so', False)
+
+
+def test_nothing_under_an_ignored_directory_is_included():
+    # as in git, a file cannot be re-included once a parent is excluded
+    r = rules('!/tmp/keep.txt', '!/vendor/bundle/Gemfile')
+    assert not r.ignored('tmp/keep.txt', False)
+    assert r.excluded('tmp/keep.txt', False)
+    assert r.excluded('vendor/bundle/Gemfile', False)
+    # re-including the directory itself brings back what is under it
+    assert not rules('!/tmp/').excluded('tmp/keep.txt', False)
+
+
+def test_re_including_a_child_of_an_ignored_parent():
+    r = rules('build/', '!build/keep/')
+    assert r.excluded('build/keep/a.txt', False)
+    r = rules('build/*', '!build/keep/')
+    assert not r.excluded('build/keep/a.txt', False)
+    assert r.excluded('build/drop/a.txt', False)
+
+
+def test_load_reads_the_ignore_file(tmp_path):
+    (tmp_path / '.fppignore').write_text('# coverage reports\ncoverage/\n!/log/\n')
+    r = IgnoreRules.load(str(tmp_path))
+    assert r.excluded('coverage/index.html', False)
+    assert not r.excluded('log/test.log', False)
+    assert IgnoreRules.load(str(tmp_path / 'missing')).excluded('log', True)
+
+
+GIT_CASES = [
+    ['doc/api', '!doc/api/keep', '*.tmp'],
+    ['**/cache/', '!spec/**/cache/', 'a?c'],
+    ['build/*', '!build/keep/', '/top.txt'],
+    ['deep/**/x.rb', '!deep/y/x.rb', '[!a]b'],
+]
+
+GIT_PATHS = [
+    'doc/api/index.html', 'doc/api/keep', 'engines/doc/api/x', 'notes.tmp', 'a/b/notes.tmp',
+    'cache/a', 'spec/cache/a', 'spec/x/cache/a', 'lib/cache/a', 'abc', 'x/abc', 'ab',
+    'build/keep/a', 'build/drop/a', 'top.txt', 'sub/top.txt', 'deep/x.rb', 'deep/y/x.rb',
+    'deep/z/w/x.rb', 'bb', 'cb',
+]
+
+
+@pytest.mark.skipif(which('git') is None, reason='needs git')
+@pytest.mark.parametrize('lines', GIT_CASES)
+def test_agrees_with_git(tmp_path, lines):
+    """Every path is kept or left out exactly as git would ignore it (the default rules aside)"""
+    for path in GIT_PATHS:
+        os.makedirs(tmp_path / os.path.dirname(path), exist_ok=True)
+        if not os.path.isdir(tmp_path / path):
+            (tmp_path / path).touch()
+    (tmp_path / '.gitignore').write_text(''.join(l + '\n' for l in lines))
+    run(['git', 'init', '-q', str(tmp_path)], check=True)
+    result = run(['git', '-C', str(tmp_path), 'ls-files', '--others', '--exclude-standard'],
+                 capture_output=True, text=True, check=True)
+    kept_by_git = set(result.stdout.split()) - { '.gitignore' }
+
+    r = rules(*lines)
+    kept = { p for p in GIT_PATHS if not r.excluded(p, False) }
+    assert kept == kept_by_git
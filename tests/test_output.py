@@ -0,0 +1,122 @@
+import os
+
+import pytest
+
+from rspecFppGen import output
+from rspecFppGen.output import QuestionWriter, default_dir_mode
+
+
+@pytest.fixture(params=['exchange', 'rename'])
+def swap(request, monkeypatch):
+    """Runs each test with the atomic exchange, and with the rename fallback used without it"""
+    if request.param == 'rename':
+        monkeypatch.setattr(output, 'exchange', lambda a, b: False)
+    return request.param
+
+
+def build(root: str, files) -> bool:
+    writer = QuestionWriter(root)
+    for rel_path, content in files.items():
+        writer.write(rel_path, content)
+    return writer.commit()
+
+
+def leftovers(root: str):
+    """Staging and trash directories left next to the question"""
+    parent, name = os.path.split(root)
+    return [n for n in os.listdir(parent) if n.startswith(f".{name}.")]
+
+
+QUESTION = {
+    'info.json': '{}\n',
+    'tests/common/app.rb': 'class App; end\n',
+    'tests/var_a/app.rb': 'class App; 1; end\n',
+    'tests/var_b/app.rb': 'class App; 2; end\n',
+}
+
+
+def test_first_build_creates_the_question(tmp_path, swap):
+    root = str(tmp_path / 'q')
+    assert build(root, QUESTION)
+    for rel_path, content in QUESTION.items():
+        assert (tmp_path / 'q' / rel_path).read_text() == content
+    assert leftovers(root) == []
+
+
+def test_unchanged_rebuild_leaves_the_question_untouched(tmp_path, swap):
+    root = str(tmp_path / 'q')
+    build(root, QUESTION)
+    before = { p: os.stat(os.path.join(root, p)) for p in [*QUESTION, '.', 'tests'] }
+
+    assert not build(root, QUESTION)
+    for rel_path, st in before.items():
+        after = os.stat(os.path.join(root, rel_path))
+        assert (after.st_ino, after.st_mtime_ns) == (st.st_ino, st.st_mtime_ns), rel_path
+    assert leftovers(root) == []
+
+
+def test_changed_rebuild_keeps_unchanged_files(tmp_path, swap):
+    root = str(tmp_path / 'q')
+    build(root, QUESTION)
+    common = os.stat(os.path.join(root, 'tests/common/app.rb'))
+
+    assert build(root, { **QUESTION, 'info.json': '{"uuid": 1}\n' })
+    assert (tmp_path / 'q' / 'info.json').read_text() == '{"uuid": 1}\n'
+    after = os.stat(os.path.join(root, 'tests/common/app.rb'))
+    assert (after.st_ino, after.st_mtime_ns) == (common.st_ino, common.st_mtime_ns)
+    assert leftovers(root) == []
+
+
+def test_stale_generated_files_are_dropped(tmp_path, swap):
+    root = str(tmp_path / 'q')
+    build(root, { **QUESTION, 'tests/common/old.rb': 'old\n' })
+
+    # nothing written changed, but variant b and old.rb are gone from the build
+    files = { p: c for p, c in QUESTION.items() if not p.startswith('tests/var_b/') }
+    assert build(root, files)
+    assert not (tmp_path / 'q' / 'tests' / 'var_b' / 'app.rb').exists()
+    assert not (tmp_path / 'q' / 'tests' / 'common' / 'old.rb').exists()
+    assert (tmp_path / 'q' / 'tests' / 'var_a' / 'app.rb').exists()
+
+
+def test_files_the_author_added_are_carried_over(tmp_path, swap):
+    root = str(tmp_path / 'q')
+    build(root, QUESTION)
+    os.makedirs(tmp_path / 'q' / 'clientFilesQuestion')
+    (tmp_path / 'q' / 'clientFilesQuestion' / 'diagram.svg').write_text('<svg/>')
+    (tmp_path / 'q' / 'tests' / 'notes.md').write_text('notes')
+    os.symlink('diagram.svg', tmp_path / 'q' / 'clientFilesQuestion' / 'latest.svg')
+
+    # an unchanged rebuild keeps them, and so does a changed one
+    assert not build(root, QUESTION)
+    assert build(root, { **QUESTION, 'info.json': '{"uuid": 1}\n' })
+    assert (tmp_path / 'q' / 'clientFilesQuestion' / 'diagram.svg').read_text() == '<svg/>'
+    assert (tmp_path / 'q' / 'tests' / 'notes.md').read_text() == 'notes'
+    assert os.readlink(tmp_path / 'q' / 'clientFilesQuestion' / 'latest.svg') == 'diagram.svg'
+
+
+def test_directory_mode_is_kept(tmp_path, swap):
+    root = str(tmp_path / 'q')
+    build(root, QUESTION)
+    # a new question gets what mkdir would give it, not the private mode of its staging directory
+    assert os.stat(root).st_mode & 0o7777 == default_dir_mode()
+
+    os.chmod(root, 0o750)
+    assert build(root, { **QUESTION, 'info.json': '{"uuid": 1}\n' })
+    assert os.stat(root).st_mode & 0o7777 == 0o750
+
+
+def test_abort_leaves_the_previous_build(tmp_path, swap):
+    root = str(tmp_path / 'q')
+    build(root, QUESTION)
+    before = { p: os.stat(os.path.join(root, p)).st_ino for p in QUESTION }
+
+    writer = QuestionWriter(root)
+    writer.write('info.json', 'half written\n')
+    writer.write('tests/var_c/app.rb', 'new\n')
+    writer.abort()
+
+    assert { p: os.stat(os.path.join(root, p)).st_ino for p in QUESTION } == before
+    assert (tmp_path / 'q' / 'info.json').read_text() == QUESTION['info.json']
+    assert not (tmp_path / 'q' / 'tests' / 'var_c').exists()
+    assert leftovers(root) == []
@@ -0,0 +1,83 @@
+import os
+from random import Random
+from shutil import which
+from subprocess import run
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from rspecFppGen.patching import PatchError, apply_diff, check_diff, split_lines
+
+# seeds of the random cases, each checked in every diff format
+SEEDS = range(200)
+
+FORMATS = {
+    'normal': [],
+    'unified': ['-u'],
+    'unified-0': ['-U0'],
+}
+
+
+def random_case(seed: int):
+    """ An original text and a random edit of it. Lines come from a small alphabet so
+        that hunks repeat, and either text may lack its trailing newline.
+    """
+    rng = Random(seed)
+    words = ['end', 'x = 1', 'return nil', 'if a < b', '', 'def f', '# note', 'y += 2']
+    original = [rng.choice(words) for _ in range(rng.randint(0, 30))]
+    modified = list(original)
+    for _ in range(rng.randint(1, 6)):
+        at = rng.randint(0, len(modified))
+        op = rng.choice('acd')
+        if op == 'a':
+            modified[at:at] = [rng.choice(words) + '!' for _ in range(rng.randint(1, 3))]
+        elif op == 'c':
+            modified[at:at + rng.randint(1, 3)] = [rng.choice(words) + '?' for _ in range(rng.randint(1, 3))]
+        else:
+            del modified[at:at + rng.randint(1, 3)]
+
+    def text(lines):
+        joined = ''.join(l + '\n' for l in lines)
+        return joined[:-1] if joined and rng.random() < 0.2 else joined
+
+    return text(original), text(modified)
+
+
+def gnu_diff(original: str, modified: str, flags):
+    with TemporaryDirectory() as tmp:
+        a, b = os.path.join(tmp, 'a'), os.path.join(tmp, 'b')
+        for path, content in ((a, original), (b, modified)):
+            with open(path, 'w', newline='') as f:
+                f.write(content)
+        result = run(['diff', *flags, a, b], capture_output=True, text=True)
+    assert result.returncode in (0, 1), result.stderr
+    return result.stdout
+
+
+@pytest.mark.skipif(which('diff') is None, reason='needs GNU diff')
+@pytest.mark.parametrize('flags', FORMATS.values(), ids=FORMATS.keys())
+@pytest.mark.parametrize('seed', SEEDS)
+def test_applies_gnu_diff(seed, flags):
+    original, modified = random_case(seed)
+    diff = gnu_diff(original, modified, flags)
+    assert apply_diff(original, diff) == modified
+    assert check_diff(split_lines(original), diff) == []
+
+
+@pytest.mark.skipif(which('diff') is None, reason='needs GNU diff')
+@pytest.mark.parametrize('flags', FORMATS.values(), ids=FORMATS.keys())
+def test_finds_hunks_at_an_offset(flags):
+    original = ''.join(f"line {i}\n" for i in range(20))
+    modified = original.replace('line 10\n', 'line ten\n')
+    diff = gnu_diff(original, modified, flags)
+    shifted = 'added 1\nadded 2\n' + original
+    assert apply_diff(shifted, diff) == 'added 1\nadded 2\n' + modified
+
+
+@pytest.mark.parametrize('diff', ['4c4\n< nope\n---\n> yes\n', '@@ -4 +4 @@\n-nope\n+yes\n'])
+def test_reports_a_hunk_that_does_not_apply(diff):
+    original = ''.join(f"line {i}\n" for i in range(8))
+    errors = check_diff(split_lines(original), diff)
+    assert len(errors) == 1 and errors[0].line == 1
+    with pytest.raises(PatchError):
+        apply_diff(original, diff)